@@ -4,6 +4,7 @@ import * as apigateway from 'aws-cdk-lib/aws-apigateway';
 import * as iam from 'aws-cdk-lib/aws-iam';
 import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as secretsmanager from 'aws-cdk-lib/aws-secretsmanager';
+import * as triggers from 'aws-cdk-lib/triggers';
 import { Construct } from 'constructs';
 import * as path from 'path';
 
@@ -11,13 +12,17 @@ export interface DealsNowBackendStackProps extends cdk.StackProps {
   deploymentRegion: 'us' | 'india';
   dbSchema: string;
   dbSecretName: string;
+  /** Optional RDS Proxy endpoint; Lambdas connect through it instead of the writer endpoint */
+  dbProxyEndpoint?: string;
+  /** Authenticate to the proxy with IAM tokens instead of the secret password */
+  dbIamAuth?: boolean;
 }
 
 export class DealsNowBackendStack extends cdk.Stack {
   constructor(scope: Construct, id: string, props: DealsNowBackendStackProps) {
     super(scope, id, props);
 
-    const { deploymentRegion, dbSchema, dbSecretName } = props;
+    const { deploymentRegion, dbSchema, dbSecretName, dbProxyEndpoint, dbIamAuth } = props;
 
     // ========================================================================
     // 1. SECRETS AND CONFIGURATION
@@ -67,6 +72,14 @@ export class DealsNowBackendStack extends cdk.Stack {
       ],
     }));
 
+    // Grant IAM database authentication (RDS Proxy)
+    if (dbIamAuth) {
+      lambdaRole.addToPolicy(new iam.PolicyStatement({
+        actions: ['rds-db:connect'],
+        resources: [`arn:aws:rds-db:${this.region}:${this.account}:dbuser:*/*`],
+      }));
+    }
+
     // Grant S3 access
     dataBucket.grantReadWrite(lambdaRole);
 
@@ -90,6 +103,8 @@ export class DealsNowBackendStack extends cdk.Stack {
       REGION: deploymentRegion,
       S3_BUCKET: bucketName,
       DEPLOYMENT_REGION: deploymentRegion,
+      ...(dbProxyEndpoint ? { DB_PROXY_ENDPOINT: dbProxyEndpoint } : {}),
+      ...(dbIamAuth ? { DB_IAM_AUTH: 'true' } : {}),
     };
 
     // ========================================================================
@@ -193,6 +208,25 @@ export class DealsNowBackendStack extends cdk.Stack {
       512
     );
 
+    // Deploy-time migration for the daily promo update: creates product_promo_history,
+    // its indexes and the run_daily_promo_update function in dbSchema, so the daily
+    // Lambda never runs DDL. Re-runs whenever the Lambda code changes; all statements are idempotent.
+    const promoMigrationFn = createFunction(
+      'PromoSchemaMigrationFunction',
+      'promo-schema-migration',
+      'update_promo_products_daily.migrate_handler',
+      'Create promo history table, indexes and update function at deploy time',
+      300,
+      256
+    );
+
+    new triggers.Trigger(this, 'PromoSchemaMigrationTrigger', {
+      handler: promoMigrationFn,
+      timeout: cdk.Duration.minutes(5),
+      executeOnHandlerChange: true,
+      executeBefore: [updatePromoFn],
+    });
+
     // Postgres to S3 dump (sync products/promos to S3 for app and web)
     // DB_NAME overrides secret (Aurora secret may have wrong dbname e.g. dealsnow_prod); use postgres default
     const postgresToS3DumpFn = createFunction(
@@ -0,0 +1,71 @@
+"""
+Shared Secrets Manager credential and database connection helpers for the Lambda functions.
+Imported by each function instead of inlining a copy (see scripts/add_secrets_manager.py).
+"""
+
+import os
+import json
+import boto3
+import pg8000
+from botocore.exceptions import ClientError
+
+# Cache credentials, the Secrets Manager client and the connection across warm invocations
+_db_credentials_cache = None
+_secrets_client = None
+_db_connection = None
+
+def get_db_credentials():
+    """Get database credentials from Secrets Manager with caching"""
+    global _db_credentials_cache, _secrets_client
+
+    if _db_credentials_cache is not None:
+        return _db_credentials_cache
+
+    secret_name = os.environ.get('DB_SECRET_NAME')
+    region = os.environ.get('AWS_REGION', 'us-east-2')
+
+    if not secret_name:
+        raise ValueError("DB_SECRET_NAME environment variable not set")
+
+    if _secrets_client is None:
+        _secrets_client = boto3.client('secretsmanager', region_name=region)
+
+    try:
+        response = _secrets_client.get_secret_value(SecretId=secret_name)
+        _db_credentials_cache = json.loads(response['SecretString'])
+        return _db_credentials_cache
+    except ClientError as e:
+        print(f"Error retrieving secret {secret_name}: {e}")
+        raise
+
+def get_db_connection():
+    """Return a cached database connection, reconnecting if it no longer answers"""
+    global _db_connection
+
+    if _db_connection is not None:
+        try:
+            cur = _db_connection.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            if not _db_connection.autocommit:
+                _db_connection.rollback()
+            return _db_connection
+        except Exception as e:
+            print(f"Cached database connection is no longer usable, reconnecting: {e}")
+            _db_connection = None
+
+    creds = get_db_credentials()
+
+    try:
+        _db_connection = pg8000.connect(
+            host=creds['host'],
+            database=creds['dbname'],
+            user=creds['username'],
+            password=creds['password'],
+            port=creds.get('port', 5432)
+        )
+        return _db_connection
+    except Exception as e:
+        print(f"Database connection error: {e}")
+        raise
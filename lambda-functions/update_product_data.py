@@ -1,11 +1,25 @@
 import json
+import logging
 import os
+import ssl
 import sys
 import time
+from contextlib import contextmanager
 from datetime import datetime
+from functools import lru_cache
 import pg8000
+from pg8000.native import identifier
 import boto3
 
+try:
+    import orjson  # faster JSON parse/serialize when packaged with the function
+except ImportError:
+    orjson = None
+
+# Per-row detail is logged at DEBUG; set LOG_LEVEL=DEBUG to see it in CloudWatch
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
 # Database configuration (env fallback when not using Secrets Manager)
 DB_HOST = os.environ.get('DB_HOST')
 DB_NAME = os.environ.get('DB_NAME')
@@ -13,6 +27,185 @@ DB_USER = os.environ.get('DB_USER')
 DB_PASSWORD = os.environ.get('DB_PASSWORD')
 DB_PORT = int(os.environ.get('DB_PORT', 5432))
 
+# Request defaults resolved once per container (COUNTRY and SCHEMA are fixed per deployment)
+CONFIG = {
+    'country': os.environ.get('COUNTRY', 'US'),
+    'schema': os.environ.get('SCHEMA'),
+}
+
+# RDS Proxy (or pgbouncer) endpoint; when set it replaces the writer host from the secret/env
+DB_PROXY_ENDPOINT = os.environ.get('DB_PROXY_ENDPOINT')
+# Authenticate with an RDS IAM token instead of the stored password (requires TLS)
+DB_IAM_AUTH = os.environ.get('DB_IAM_AUTH', '').lower() in ('1', 'true', 'yes')
+# IAM auth tokens are valid for 15 minutes; regenerate well before they expire
+IAM_TOKEN_TTL_SECONDS = 600
+# RDS CA bundle (e.g. global-bundle.pem) for direct Aurora endpoints, whose certificates are
+# not in the default trust store; RDS Proxy certificates are publicly trusted and need no bundle
+DB_SSL_CA_FILE = os.environ.get('DB_SSL_CA_FILE')
+
+def _build_ssl_context():
+    """Default trust store plus the RDS CA bundle when DB_SSL_CA_FILE is set."""
+    context = ssl.create_default_context()
+    if DB_SSL_CA_FILE:
+        context.load_verify_locations(cafile=DB_SSL_CA_FILE)
+    elif not DB_PROXY_ENDPOINT:
+        logger.warning("DB_IAM_AUTH without DB_PROXY_ENDPOINT needs DB_SSL_CA_FILE (RDS CA bundle); "
+                       "the TLS handshake with a direct Aurora endpoint will fail")
+    return context
+
+# TLS context built once at import and reused by every (re)connect
+_SSL_CONTEXT = _build_ssl_context() if DB_IAM_AUTH else None
+
+# Columns copied into {schema}.product_history (also RETURNed by product writes in this order)
+_HIST_COLS = ('product_id', 'product_key', 'product_name', 'original_price', 'deal_price', 'discount_percent', 'updated_at')
+_HIST_COLS_SQL = ', '.join(_HIST_COLS)
+_HIST_PLACEHOLDERS = ', '.join(['%s'] * len(_HIST_COLS))
+
+# COPY text-format escaping (backslash first so the other escapes are not doubled)
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+# Responses only report the first few row failures, so only that many are kept in memory
+MAX_ERROR_DETAILS = 10
+
+# Import Configuration deal_type text -> deal_type_id (unknown types default to 2)
+_DEAL_TYPE_MAP = {'hot deal': 1, 'hotdeal': 1, 'sale': 2, 'clearance': 2, 'discount': 2}
+
+# Map of frontend field names to database column names
+# Based on actual product_staging table columns
+_FIELD_MAPPING = {
+    'product_name': 'product_name',
+    'description': 'description',
+    'deal_price': 'deal_price',
+    'original_price': 'original_price',
+    'image_url': 'image_url',
+    'image_url_1': 'image_url_1',
+    'image_url_2': 'image_url_2', 
+    'image_url_3': 'image_url_3',
+    'category': 'category',
+    'deal_type': 'deal_type',
+    'retailer': 'retailer',
+    'sale_url': 'sale_url',
+    'product_key': 'product_key',
+    'product_rating': 'product_rating',
+    'product_keywords': 'product_keywords',
+    'is_active': 'is_active',
+    'deal_type_id': 'deal_type_id',
+    'brand': 'brand',
+    'discount_percent': 'discount_percent',
+    'product_type': 'product_type',
+    'coupon_info': 'coupon_info',
+    'category_list': 'category_list',
+    'start_date': 'start_date',
+    'end_date': 'end_date',
+    'promo_label': 'promo_label',
+    'stock_status': 'stock_status'
+    # Note: Excluded columns that are auto-generated or not provided by CSV:
+    # product_id, category_id, seller_id, ts_vector, wix_id, owner, embedding, 
+    # iscount_percent, source_product_id
+}
+
+# Bulk import column list and upsert SQL are fixed; only the target table varies
+_COLUMNS = ['created_at', 'updated_at'] + list(_FIELD_MAPPING.values())
+_COLUMNS_STR = ', '.join(_COLUMNS)
+# SET clause for UPDATE (exclude created_at, updated_at, and product_id from updates)
+_UPDATE_CLAUSE = ', '.join(f"{col} = EXCLUDED.{col}" for col in _COLUMNS if col not in ('created_at', 'updated_at', 'product_id'))
+# Timestamps the import did not supply arrive as NULL and are filled in by the database
+_BULK_SELECT = ', '.join(f"COALESCE({col}, NOW())" if col in ('created_at', 'updated_at') else col for col in _COLUMNS)
+_BULK_VALUES_ROW = '(' + ', '.join('COALESCE(%s, NOW())' if col in ('created_at', 'updated_at') else '%s' for col in _COLUMNS) + ')'
+# xmax is 0 only for freshly inserted rows, so RETURNING classifies inserts vs updates;
+# the counts are aggregated server-side so one row comes back instead of one per product
+_BULK_UPSERT_TMPL = f"""
+    WITH upserted AS (
+        INSERT INTO {{table_name}} (
+            {_COLUMNS_STR}
+        )
+        {{source}}
+        ON CONFLICT (product_key) 
+        DO UPDATE SET 
+            {_UPDATE_CLAUSE},
+            updated_at = EXCLUDED.updated_at
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM upserted
+"""
+_bulk_sql_cache = {}  # table_name -> (create temp table, COPY, upsert, VALUES upsert) statements
+# Smaller imports skip the temp table and COPY and upsert with one multi-row INSERT ... VALUES
+# (at 28 columns per row this stays under PostgreSQL's 32767 bind parameter limit)
+BULK_COPY_MIN_ROWS = 1000
+_move_sql_cache = {}  # schema -> move_to_production statement
+
+# Loads at least this large refresh planner statistics on the tables they touched
+ANALYZE_MIN_ROWS = 1000
+
+# Dropdown options change rarely; warm invocations serve them from memory for this long
+DROPDOWN_CACHE_TTL_SECONDS = 120
+
+# Largest number of distinct product IDs one delete_products request may send
+MAX_DELETE_IDS = 20000
+# Larger deletes are split into statements of this many IDs inside one transaction
+DELETE_CHUNK_SIZE = 5000
+
+# A shared connection idle for at least this long is probed with SELECT 1 before reuse
+DB_LIVENESS_CHECK_SECONDS = 30
+
+# Response headers; browsers only read the Allow-Headers/Allow-Methods pair on the OPTIONS
+# preflight, so data responses carry just the origin and content type
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
+    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE',
+    'Access-Control-Max-Age': '86400'
+}
+RUNTIME_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+# Global clients/tokens for Lambda optimization (reuse across invocations)
+_rds_client = None
+_iam_token_cache = {}
+_db_connection = None  # reused by warm invocations; see get_shared_db_connection()
+_db_connection_used_at = 0.0  # time.monotonic() when the shared connection was last handed out
+_dropdown_cache = {}  # schema -> (fetched_at, result)
+
+def _json_loads(data):
+    """Parse a JSON request body, using orjson when available."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _json_dumps(obj):
+    """Serialize a response body to a JSON string, using orjson when available."""
+    if orjson:
+        # Passthrough keeps datetimes formatted by str() exactly as json.dumps(default=str) does
+        return orjson.dumps(obj, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    return json.dumps(obj, default=str, separators=(',', ':'))
+
+def _response(status_code, payload, preflight=False):
+    """Build an API Gateway response with the CORS headers; str payloads are pre-serialized bodies."""
+    return {
+        'statusCode': status_code,
+        'headers': PREFLIGHT_HEADERS if preflight else RUNTIME_HEADERS,
+        'body': payload if isinstance(payload, str) else _json_dumps(payload)
+    }
+
+def _error_body(message):
+    """Serialize a fixed failure body ({'success': False, 'message': message})."""
+    return _json_dumps({'success': False, 'message': message})
+
+# Fixed failure bodies, serialized once at import
+_INVALID_JSON_BODY = _error_body("Invalid JSON in request body")
+_MISSING_BODY_BODY = _error_body("Missing or invalid request body")
+_NO_UPDATE_PRODUCTS_BODY = _error_body("No products provided for update")
+_NO_MOVE_PRODUCTS_BODY = _error_body("No products or product IDs provided for move to production")
+_MOVE_NEEDS_PRODUCT_DATA_BODY = _error_body("Please provide complete product data for move to production")
+_MISSING_PROMO_LABEL_BODY = _error_body("Missing promo label in request body")
+_NO_BULK_PRODUCTS_BODY = _error_body("No products provided for bulk insertion")
+_NO_PRODUCT_IDS_BODY = _error_body("No product IDs provided or invalid format")
+_TOO_MANY_PRODUCT_IDS_BODY = _error_body(f"Too many product IDs; at most {MAX_DELETE_IDS} can be deleted per request")
+_INVALID_PRODUCT_ID_BODY = _error_body("Product IDs must be strings or integers")
+_DB_CONNECTION_FAILED_BODY = _error_body("Database connection failed")
+
 def clean_text_field(text):
     """Clean text fields by replacing common HTML entities and formatting issues."""
     if not text:
@@ -23,30 +216,112 @@ def clean_text_field(text):
     
     return text
 
+def _to_int_discount(value):
+    """Coerce a discount value to an int (rounded half away from zero); blanks and bad input become 0."""
+    if value is None or value == '':
+        return 0
+    try:
+        number = float(value)
+        return int(number + 0.5) if number >= 0 else -int(-number + 0.5)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+def _to_rating(value):
+    """Convert a product_rating value to float, defaulting to 4.5 when empty or invalid."""
+    if not value:
+        return 4.5
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 4.5
+
+def _row_transform(frontend_field, db_field):
+    """Return the function that builds db_field's bulk import value from a product dict."""
+    if db_field == 'discount_percent':
+        return lambda product: _to_int_discount(product.get(frontend_field))
+    if db_field == 'deal_type_id':
+        # Use deal_type from Import Configuration, default to 2
+        return lambda product: _DEAL_TYPE_MAP.get(product.get('deal_type', 'Hot Deal').lower(), 2)
+    if db_field == 'product_rating':
+        return lambda product: _to_rating(product.get(frontend_field))
+    if db_field in ('start_date', 'end_date'):
+        return lambda product: None if product.get(frontend_field, '') == '' else product[frontend_field]
+    if db_field in ('product_name', 'description'):
+        return lambda product: clean_text_field(product.get(frontend_field, ''))
+    return lambda product: product.get(frontend_field, '')
+
+# One transform per _FIELD_MAPPING column, in _COLUMNS order after created_at/updated_at
+_ROW_TRANSFORMS = tuple(_row_transform(frontend_field, db_field) for frontend_field, db_field in _FIELD_MAPPING.items())
+
+def _copy_text_value(value):
+    """Render a value for COPY ... FROM STDIN text format; None becomes the \\N null marker."""
+    if value is None:
+        return '\\N'
+    return str(value).translate(_COPY_ESCAPES)
+
+def _copy_chunks(rows, rows_per_chunk=1000):
+    """Yield COPY text-format data as UTF-8 bytes, one chunk (CopyData message) per rows_per_chunk rows."""
+    lines = []
+    for values in rows:
+        lines.append('\t'.join([_copy_text_value(value) for value in values]))
+        if len(lines) == rows_per_chunk:
+            lines.append('')
+            yield '\n'.join(lines).encode('utf-8')
+            lines = []
+    if lines:
+        lines.append('')
+        yield '\n'.join(lines).encode('utf-8')
+
+def get_iam_auth_token(host, port, user):
+    """Return a cached RDS IAM auth token for host/port/user, regenerating it after IAM_TOKEN_TTL_SECONDS."""
+    global _rds_client
+    key = (host, port, user)
+    cached = _iam_token_cache.get(key)
+    if cached and time.time() - cached[0] < IAM_TOKEN_TTL_SECONDS:
+        return cached[1]
+    if _rds_client is None:
+        _rds_client = boto3.client('rds')
+    token = _rds_client.generate_db_auth_token(DBHostname=host, Port=port, DBUsername=user)
+    _iam_token_cache[key] = (time.time(), token)
+    return token
+
 def get_db_connection():
-    """Connect via AWS Secrets Manager (Aurora PostgreSQL) or DB_* env. Port 5432 for Aurora."""
+    """Connect via AWS Secrets Manager (Aurora PostgreSQL) or DB_* env. Port 5432 for Aurora.
+
+    When DB_PROXY_ENDPOINT is set the connection goes through RDS Proxy, and DB_IAM_AUTH
+    swaps the password for a cached IAM auth token. IAM auth against a direct Aurora
+    endpoint also needs DB_SSL_CA_FILE pointing at the RDS CA bundle.
+    """
     try:
         secret_name = os.environ.get('DB_SECRET_NAME') or os.environ.get('DB_SECRET_ARN')
         if secret_name:
             client = boto3.client('secretsmanager')
             r = client.get_secret_value(SecretId=secret_name)
-            cred = json.loads(r['SecretString'])
-            return pg8000.connect(
-                host=cred.get('host') or cred.get('endpoint'),
-                port=int(cred.get('port', 5432)),
-                database=cred.get('dbname') or cred.get('database') or 'postgres',
-                user=cred.get('username') or cred.get('user'),
-                password=cred.get('password')
-            )
-        if not all([DB_HOST, DB_USER, DB_PASSWORD]):
-            print("Missing required database configuration (DB_SECRET_NAME or DB_HOST/DB_USER/DB_PASSWORD)")
-            return None
+            cred = _json_loads(r['SecretString'])
+            host = cred.get('host') or cred.get('endpoint')
+            port = int(cred.get('port', 5432))
+            database = cred.get('dbname') or cred.get('database') or 'postgres'
+            user = cred.get('username') or cred.get('user')
+            password = cred.get('password')
+        else:
+            if not all([DB_HOST, DB_USER]) or not (DB_PASSWORD or DB_IAM_AUTH):
+                print("Missing required database configuration (DB_SECRET_NAME or DB_HOST/DB_USER/DB_PASSWORD)")
+                return None
+            host, port, database, user, password = DB_HOST, DB_PORT, DB_NAME or 'postgres', DB_USER, DB_PASSWORD
+
+        host = DB_PROXY_ENDPOINT or host
+        ssl_context = None
+        if DB_IAM_AUTH:
+            password = get_iam_auth_token(host, port, user)
+            ssl_context = _SSL_CONTEXT  # IAM authentication is only accepted over TLS
+
         return pg8000.connect(
-            host=DB_HOST,
-            database=DB_NAME or 'postgres',
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
+            host=host,
+            database=database,
+            user=user,
+            password=password,
+            port=port,
+            ssl_context=ssl_context
         )
     except pg8000.Error as e:
         print(f"Database connection error: {e}")
@@ -55,13 +330,117 @@ def get_db_connection():
         print(f"Unexpected error during database connection: {e}")
         return None
 
+def execute_values(cur, sql, rows, template=None, page_size=100, fetch=False):
+    """pg8000 counterpart of psycopg2.extras.execute_values.
+
+    `sql` must contain a single %s placeholder after VALUES; it is expanded into one
+    `template` group per row (default (%s, ...)) so each page of rows is sent as one
+    multi-row statement. Returns the fetched rows of every page when fetch=True (e.g.
+    for RETURNING).
+    """
+    head, tail = sql.split('%s', 1)
+    results = []
+    for i in range(0, len(rows), page_size):
+        page = rows[i:i + page_size]
+        row_placeholders = template or '(' + ', '.join(['%s'] * len(page[0])) + ')'
+        cur.execute(
+            head + ', '.join([row_placeholders] * len(page)) + tail,
+            [value for row in page for value in row]
+        )
+        if fetch:
+            results.extend(cur.fetchall())
+    return results if fetch else None
+
+def get_shared_db_connection():
+    """Return the module-level connection, opening it on first use (or after a reset).
+
+    Warm Lambda invocations reuse it instead of paying a new TCP/TLS/auth handshake. A
+    connection idle for DB_LIVENESS_CHECK_SECONDS or more is probed first, since the server,
+    proxy or a NAT may have dropped it while the container was frozen.
+    """
+    global _db_connection, _db_connection_used_at
+    now = time.monotonic()
+    if _db_connection is not None and now - _db_connection_used_at >= DB_LIVENESS_CHECK_SECONDS:
+        try:
+            cur = _db_connection.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchall()
+            cur.close()
+            _db_connection.rollback()
+        except Exception as e:
+            print(f"Shared database connection is stale, reconnecting: {e}")
+            reset_db_connection()
+    if _db_connection is None:
+        _db_connection = get_db_connection()
+    _db_connection_used_at = now
+    return _db_connection
+
+def reset_db_connection():
+    """Drop the shared connection so the next call reconnects."""
+    global _db_connection
+    conn, _db_connection = _db_connection, None
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+def release_db_connection(conn, error=None):
+    """End any transaction left open on the shared connection without closing it.
+
+    Connection-level failures (pg8000.InterfaceError, or a failing rollback) reset the
+    shared connection instead.
+    """
+    if conn is None:
+        return
+    if isinstance(error, pg8000.InterfaceError):
+        reset_db_connection()
+        return
+    try:
+        conn.rollback()  # no-op when the transaction was already committed
+    except Exception:
+        reset_db_connection()
+
+@contextmanager
+def db_cursor(conn):
+    """Yield a cursor on the shared connection, then close it and release the connection.
+
+    An exception raised inside the block is passed to release_db_connection(), so the
+    transaction is rolled back (or a broken connection reset) before it propagates.
+    """
+    cur = conn.cursor()
+    error = None
+    try:
+        yield cur
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        cur.close()
+        release_db_connection(conn, error)
+
+def insert_history_rows(cur, history_table, rows):
+    """Write accumulated product_history rows (tuples in _HIST_COLS order) with multi-row INSERTs."""
+    execute_values(cur, f"INSERT INTO {history_table} ({_HIST_COLS_SQL}) VALUES %s", rows, page_size=500)
+
+def analyze_after_load(conn, cur, table_name, row_count):
+    """ANALYZE table_name after a committed load of ANALYZE_MIN_ROWS+ rows; failures only log a warning."""
+    if row_count < ANALYZE_MIN_ROWS:
+        return
+    try:
+        cur.execute(f"ANALYZE {table_name}")
+        conn.commit()
+    except pg8000.DatabaseError as e:
+        conn.rollback()
+        print(f"⚠️ Warning: Could not analyze {table_name}: {e}")
+
 def insert_product(product_data, table_name):
     """Insert a new product into the database."""
     conn = None
     cur = None
     
     try:
-        conn = get_db_connection()
+        conn = get_shared_db_connection()
         if not conn:
             return {
                 "success": False,
@@ -70,40 +449,6 @@ def insert_product(product_data, table_name):
             
         cur = conn.cursor()
         
-        # Map of frontend field names to database column names
-        # Based on actual product_staging table columns
-        field_mapping = {
-            'product_name': 'product_name',
-            'description': 'description',
-            'deal_price': 'deal_price',
-            'original_price': 'original_price',
-            'image_url': 'image_url',
-            'image_url_1': 'image_url_1',
-            'image_url_2': 'image_url_2', 
-            'image_url_3': 'image_url_3',
-            'category': 'category',
-            'deal_type': 'deal_type',
-            'retailer': 'retailer',
-            'sale_url': 'sale_url',
-            'product_key': 'product_key',
-            'product_rating': 'product_rating',
-            'product_keywords': 'product_keywords',
-            'is_active': 'is_active',
-            'deal_type_id': 'deal_type_id',
-            'brand': 'brand',
-            'discount_percent': 'discount_percent',
-            'product_type': 'product_type',
-            'coupon_info': 'coupon_info',
-            'category_list': 'category_list',
-            'start_date': 'start_date',
-            'end_date': 'end_date',
-            'promo_label': 'promo_label',
-            'stock_status': 'stock_status'
-            # Note: Excluded columns that are auto-generated or not provided by CSV:
-            # product_id, category_id, seller_id, ts_vector, wix_id, owner, embedding, 
-            # iscount_percent, source_product_id
-        }
-        
         # Prepare column names and values for insertion
         columns = []
         placeholders = []
@@ -116,7 +461,7 @@ def insert_product(product_data, table_name):
         values.extend([now, now])
         
         # Add product fields
-        for frontend_field, db_field in field_mapping.items():
+        for frontend_field, db_field in _FIELD_MAPPING.items():
             if frontend_field in product_data:
                 columns.append(db_field)
                 placeholders.append('%s')
@@ -126,11 +471,7 @@ def insert_product(product_data, table_name):
                     values.append(None)
                 # Handle discount_percent as integer
                 elif db_field == 'discount_percent':
-                    try:
-                        discount_value = float(product_data[frontend_field]) if product_data[frontend_field] else 0
-                        values.append(int(round(discount_value)))
-                    except (ValueError, TypeError):
-                        values.append(0)
+                    values.append(_to_int_discount(product_data[frontend_field]))
                 # Clean text fields (product_name and description)
                 elif db_field in ('product_name', 'description'):
                     values.append(clean_text_field(product_data[frontend_field]))
@@ -138,78 +479,64 @@ def insert_product(product_data, table_name):
                     values.append(product_data[frontend_field])
         
         # Build and execute upsert query (INSERT or UPDATE on conflict)
-        # First, check if product_key exists
+        # Try the INSERT first and only fall back to an UPDATE when product_key already exists,
+        # so new products cost a single round-trip. ON CONFLICT relies on the unique index
+        # (one-time migration: CREATE UNIQUE INDEX IF NOT EXISTS ux_product_key ON {table}(product_key))
         product_key = None
-        existing_product = None
+        existing_product = False
         
         for i, col in enumerate(columns):
             if col == 'product_key':
                 product_key = values[i]
                 break
         
-        if product_key:
-            # Check if product already exists
-            cur.execute(f"SELECT product_id FROM {table_name} WHERE product_key = %s", (product_key,))
-            existing_product = cur.fetchone()
-            
-            if existing_product:
-                # Product exists, update it instead of inserting
-                print(f"Product with key {product_key} already exists, updating...")
-                
-                # Build update query (exclude created_at and product_id from updates)
-                update_columns = [col for col in columns if col not in ['created_at', 'product_id']]
-                update_values = [values[i] for i, col in enumerate(columns) if col not in ['created_at', 'product_id']]
-                
-                update_parts = []
-                for col in update_columns:
-                    update_parts.append(f"{col} = %s")
-                
-                update_query = f"""
-                    UPDATE {table_name}
-                    SET {', '.join(update_parts)}
-                    WHERE product_key = %s
-                    RETURNING product_id
-                """
-                update_values.append(product_key)
-                
-                print(f"Update query: {update_query}")
-                print(f"Update values: {update_values}")
-                
-                cur.execute(update_query, update_values)
-                new_product_id = cur.fetchone()[0]
-                print(f"✅ Updated existing product with ID: {new_product_id}")
-            else:
-                # Product doesn't exist, insert new one
-                insert_query = f"""
-                    INSERT INTO {table_name} (
-                        {', '.join(columns)}
-                    ) VALUES (
-                        {', '.join(placeholders)}
-                    ) RETURNING product_id
-                """
-                
-                print(f"Insert query: {insert_query}")
-                print(f"Values: {values}")
-                
-                cur.execute(insert_query, values)
-                new_product_id = cur.fetchone()[0]
-                print(f"✅ Inserted new product with ID: {new_product_id}")
+        conflict_clause = "ON CONFLICT (product_key) DO NOTHING" if product_key else ""
+        insert_query = f"""
+            INSERT INTO {table_name} (
+                {', '.join(columns)}
+            ) VALUES (
+                {', '.join(placeholders)}
+            ) {conflict_clause}
+            RETURNING {_HIST_COLS_SQL}
+        """
+        
+        logger.debug("Insert query: %s", insert_query)
+        logger.debug("Values: %s", values)
+        
+        cur.execute(insert_query, values)
+        product_row = cur.fetchone()
+        
+        if product_row:
+            new_product_id = product_row[0]
+            print(f"✅ Inserted new product with ID: {new_product_id}")
         else:
-            # No product_key provided, use regular insert
-            insert_query = f"""
-                INSERT INTO {table_name} (
-                    {', '.join(columns)}
-                ) VALUES (
-                    {', '.join(placeholders)}
-                ) RETURNING product_id
+            # Product exists, update it instead of inserting
+            existing_product = True
+            print(f"Product with key {product_key} already exists, updating...")
+            
+            # Build update query (exclude created_at and product_id from updates)
+            update_columns = [col for col in columns if col not in ['created_at', 'product_id']]
+            update_values = [values[i] for i, col in enumerate(columns) if col not in ['created_at', 'product_id']]
+            
+            update_parts = []
+            for col in update_columns:
+                update_parts.append(f"{col} = %s")
+            
+            update_query = f"""
+                UPDATE {table_name}
+                SET {', '.join(update_parts)}
+                WHERE product_key = %s
+                RETURNING {_HIST_COLS_SQL}
             """
+            update_values.append(product_key)
             
-            print(f"Insert query: {insert_query}")
-            print(f"Values: {values}")
+            logger.debug("Update query: %s", update_query)
+            logger.debug("Update values: %s", update_values)
             
-            cur.execute(insert_query, values)
-            new_product_id = cur.fetchone()[0]
-            print(f"✅ Inserted new product with ID: {new_product_id}")
+            cur.execute(update_query, update_values)
+            product_row = cur.fetchone()
+            new_product_id = product_row[0]
+            print(f"✅ Updated existing product with ID: {new_product_id}")
         
         # Create initial history entry for new product
         try:
@@ -217,30 +544,12 @@ def insert_product(product_data, table_name):
             schema_name = table_name.split('.')[0]
             history_table = f'{schema_name}.product_history'
             
-            # Get the inserted product data for history
-            cur.execute(f"SELECT * FROM {table_name} WHERE product_id = %s", (new_product_id,))
-            product_row = cur.fetchone()
-            if product_row:
-                colnames = [desc[0] for desc in cur.description]
-                product_data = dict(zip(colnames, product_row))
-                
-                # Create history entry with key fields
-                hist_cols = ['product_id', 'product_key', 'product_name', 'original_price', 'deal_price', 'discount_percent', 'updated_at']
-                hist_vals = [
-                    product_data.get('product_id'),
-                    product_data.get('product_key'),
-                    product_data.get('product_name'),
-                    product_data.get('original_price'),
-                    product_data.get('deal_price'),
-                    product_data.get('discount_percent'),
-                    product_data.get('updated_at')
-                ]
-                
-                cur.execute(
-                    f"INSERT INTO {history_table} ({', '.join(hist_cols)}) VALUES ({', '.join(['%s']*len(hist_cols))})",
-                    hist_vals
-                )
-                print(f"✅ Created initial history entry for new product {new_product_id}")
+            # The write above RETURNed the history columns in _HIST_COLS order
+            cur.execute(
+                f"INSERT INTO {history_table} ({_HIST_COLS_SQL}) VALUES ({_HIST_PLACEHOLDERS})",
+                list(product_row)
+            )
+            print(f"✅ Created initial history entry for new product {new_product_id}")
         except Exception as e:
             print(f"⚠️ Warning: Could not create history entry for new product {new_product_id}: {e}")
             # Don't fail the entire operation if history creation fails
@@ -258,8 +567,7 @@ def insert_product(product_data, table_name):
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
+        release_db_connection(conn, e)
         print(f"Error during insert: {e}")
         return {
             "success": False,
@@ -268,58 +576,24 @@ def insert_product(product_data, table_name):
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 def update_products(products, table_name):
     import sys
     import time
     start_time = time.time()
-    print(f"[DEBUG] update_products called for table: {table_name}", file=sys.stderr)
-    print(f"[DEBUG] Products received: {products}", file=sys.stderr)
+    logger.debug("update_products called for table: %s, products: %s", table_name, products)
     if not products:
         return {
             "success": False,
             "message": "No products provided for update"
         }
-        
-    field_mapping = {
-        'product_name': 'product_name',
-        'description': 'description',
-        'deal_price': 'deal_price',
-        'original_price': 'original_price',
-        'image_url': 'image_url',
-        'image_url_1': 'image_url_1',
-        'image_url_2': 'image_url_2', 
-        'image_url_3': 'image_url_3',
-        'category': 'category',
-        'deal_type': 'deal_type',
-        'retailer': 'retailer',
-        'sale_url': 'sale_url',
-        'product_key': 'product_key',
-        'product_rating': 'product_rating',
-        'product_keywords': 'product_keywords',
-        'is_active': 'is_active',
-        'deal_type_id': 'deal_type_id',
-        'brand': 'brand',
-        'discount_percent': 'discount_percent',
-        'product_type': 'product_type',
-        'coupon_info': 'coupon_info',
-        'category_list': 'category_list',
-        'start_date': 'start_date',
-        'end_date': 'end_date',
-        'promo_label': 'promo_label',
-        'stock_status': 'stock_status'
-        # Note: Excluded columns that are auto-generated or not provided by CSV:
-        # product_id, category_id, seller_id, ts_vector, wix_id, owner, embedding, 
-        # iscount_percent, source_product_id
-    }
     
     conn = None
     cur = None
     
     try:
-        conn = get_db_connection()
+        conn = get_shared_db_connection()
         if not conn:
             print("[ERROR] No DB connection", file=sys.stderr)
             return {
@@ -330,6 +604,8 @@ def update_products(products, table_name):
         
         success_count = 0
         failed_products = []
+        col_index = None  # column name -> tuple position, computed from the first SELECT *
+        history_rows = []  # flushed with one multi-row INSERT before commit
         
         for product in products:
             if not isinstance(product, dict):
@@ -343,9 +619,7 @@ def update_products(products, table_name):
                         "product": product.get('name', 'Unknown product')
                     })
                     continue
-                print(f"Processing product ID: {product_id}")
-                print(f"Product data received: {product}")
-                print(f"Promo label in product: {product.get('promo_label', 'NOT_FOUND')}")
+                logger.debug("Processing product ID: %s, data: %s", product_id, product)
 
                 # --- PRODUCTION TABLE SPECIAL LOGIC ---
                 # Extract schema from table_name for history table
@@ -355,68 +629,40 @@ def update_products(products, table_name):
                     cur.execute(f"SELECT * FROM {table_name} WHERE product_id = %s", (product_id,))
                     current_row = cur.fetchone()
                     if current_row:
-                        colnames = [desc[0] for desc in cur.description]
-                        current_data = dict(zip(colnames, current_row))
-                        new_deal_price = float(product.get('deal_price', current_data.get('deal_price', 0)))
-                        new_orig_price = float(product.get('original_price', current_data.get('original_price', 0)))
+                        if col_index is None:
+                            col_index = {desc[0]: i for i, desc in enumerate(cur.description)}
+                        current_deal_price = current_row[col_index['deal_price']]
+                        current_orig_price = current_row[col_index['original_price']]
+                        new_deal_price = float(product.get('deal_price', current_deal_price))
+                        new_orig_price = float(product.get('original_price', current_orig_price))
                         price_changed = (
-                            new_deal_price != float(current_data.get('deal_price', 0)) or
-                            new_orig_price != float(current_data.get('original_price', 0))
+                            new_deal_price != float(current_deal_price) or
+                            new_orig_price != float(current_orig_price)
                         )
                         
                         if price_changed:
                             # PRICES CHANGED: Create history and new record
-                            print(f"Price changed for product {product_id}, creating history and new record")
+                            logger.debug("Price changed for product %s, creating history and new record", product_id)
                             
                             # Move only selected columns to history (now including product_key)
-                            hist_cols = ['product_id', 'product_key', 'product_name', 'original_price', 'deal_price', 'discount_percent', 'updated_at']
-                            hist_vals = [
-                                current_data.get('product_id'),
-                                current_data.get('product_key'),
-                                current_data.get('product_name'),
-                                current_data.get('original_price'),
-                                current_data.get('deal_price'),
-                                current_data.get('discount_percent'),
-                                current_data.get('updated_at')
-                            ]
-                            cur.execute(
-                                f"INSERT INTO {schema_name}.product_history ({', '.join(hist_cols)}) VALUES ({', '.join(['%s']*len(hist_cols))})",
-                                hist_vals
-                            )
+                            hist_vals = tuple(current_row[col_index[col]] for col in _HIST_COLS)
                             # Remove old record from product table before inserting new one
                             cur.execute(f"DELETE FROM {table_name} WHERE product_id = %s", (product_id,))
                             # Insert new record into product with all changed fields from incoming product
-                            update_data = current_data.copy()
-                            for frontend_field, db_field in field_mapping.items():
+                            update_data = {col: current_row[i] for col, i in col_index.items()}
+                            for frontend_field, db_field in _FIELD_MAPPING.items():
                                 # Always set product_keywords from incoming product, even if empty or missing
                                 if db_field == 'product_keywords':
                                     update_data[db_field] = product.get('product_keywords', '')
                                 elif frontend_field in product:
                                     # Handle discount_percent as integer
                                     if db_field == 'discount_percent':
-                                        try:
-                                            discount_value = float(product[frontend_field]) if product[frontend_field] else 0
-                                            update_data[db_field] = int(round(discount_value))
-                                        except (ValueError, TypeError):
-                                            update_data[db_field] = 0
+                                        update_data[db_field] = _to_int_discount(product[frontend_field])
                                     # Clean text fields (product_name and description)
                                     elif db_field in ('product_name', 'description'):
                                         update_data[db_field] = clean_text_field(product[frontend_field])
                                     else:
                                         update_data[db_field] = product[frontend_field]
-                            # Overwrite all fields in update_data with any present in the incoming product
-                            for frontend_field, db_field in field_mapping.items():
-                                if frontend_field in product:
-                                    if db_field == 'discount_percent':
-                                        try:
-                                            discount_value = float(product[frontend_field]) if product[frontend_field] else 0
-                                            update_data[db_field] = int(round(discount_value))
-                                        except (ValueError, TypeError):
-                                            update_data[db_field] = 0
-                                    elif db_field in ('product_name', 'description'):
-                                        update_data[db_field] = clean_text_field(product[frontend_field])
-                                    else:
-                                        update_data[db_field] = product[frontend_field]
                             # Handle empty string for start_date/end_date
                             for date_field in ['start_date', 'end_date']:
                                 if date_field in update_data and update_data[date_field] == '':
@@ -431,11 +677,12 @@ def update_products(products, table_name):
                                 tuple(update_data.values())
                             )
                             new_product_id = cur.fetchone()[0]
+                            history_rows.append(hist_vals)
                             success_count += 1
                             continue  # Skip normal update logic
                         else:
                             # PRICES DIDN'T CHANGE: Use normal UPDATE logic (no history, no new record)
-                            print(f"Price unchanged for product {product_id}, using normal UPDATE")
+                            logger.debug("Price unchanged for product %s, using normal UPDATE", product_id)
                             # Continue to the normal update logic below
                 # Build update query dynamically based on provided fields
                 update_parts = []
@@ -451,18 +698,14 @@ def update_products(products, table_name):
                 params.append(product.get('deal_price'))
                 update_parts.append("original_price = %s")
                 params.append(product.get('original_price'))
-                for frontend_field, db_field in field_mapping.items():
+                for frontend_field, db_field in _FIELD_MAPPING.items():
                     if frontend_field in product and db_field not in ['product_name', 'deal_price', 'original_price']:
                         if db_field in ('start_date', 'end_date') and product[frontend_field] == '':
                             update_parts.append(f"{db_field} = NULL")
                         # Handle discount_percent as integer
                         elif db_field == 'discount_percent':
                             update_parts.append(f"{db_field} = %s")
-                            try:
-                                discount_value = float(product[frontend_field]) if product[frontend_field] else 0
-                                params.append(int(round(discount_value)))
-                            except (ValueError, TypeError):
-                                params.append(0)
+                            params.append(_to_int_discount(product[frontend_field]))
                         # Clean text fields (product_name and description)
                         elif db_field in ('product_name', 'description'):
                             update_parts.append(f"{db_field} = %s")
@@ -497,16 +740,19 @@ def update_products(products, table_name):
                 print(f"Error processing product: {e}")
                 if conn:
                     conn.rollback()
+                    history_rows.clear()  # their product writes were rolled back too
                 failed_products.append({
                     "reason": str(e),
                     "product": product.get('name', 'Unknown product')
                 })
 
+        insert_history_rows(cur, f"{table_name.split('.')[0]}.product_history", history_rows)
         conn.commit()
 
         # Prepare result message
         end_time = time.time()
-        print(f"[DEBUG] update_products completed in {end_time - start_time:.2f} seconds", file=sys.stderr)
+        logger.info("Updated %d/%d products in %s in %.2f seconds, %d failed",
+                    success_count, len(products), table_name, end_time - start_time, len(failed_products))
         
         result_message = f"Successfully updated {success_count} out of {len(products)} products"
         if failed_products:
@@ -524,8 +770,7 @@ def update_products(products, table_name):
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
+        release_db_connection(conn, e)
         print(f"Error during update: {e}")
         return {
             "success": False,
@@ -534,8 +779,7 @@ def update_products(products, table_name):
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 def move_to_production(products_data, schema='deals_master'):
     """Move products from staging to production using complete product data and delete from staging."""
@@ -549,7 +793,7 @@ def move_to_production(products_data, schema='deals_master'):
     cur = None
     
     try:
-        conn = get_db_connection()
+        conn = get_shared_db_connection()
         if not conn:
             return {
                 "success": False,
@@ -561,10 +805,11 @@ def move_to_production(products_data, schema='deals_master'):
         # Set timestamps
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        # Insert products into production and track successful moves
-        success_count = 0
-        failed_products = []
-        successful_product_keys = []  # Track successfully moved products for deletion
+        # Build production rows and track products that could not be converted
+        failed_count = 0
+        failed_products = []  # first MAX_ERROR_DETAILS failures only
+        rows_by_key = {}  # product_key -> row; the last occurrence of a key wins
+        columns = None
         
         for product in products_data:
             try:
@@ -588,7 +833,7 @@ def move_to_production(products_data, schema='deals_master'):
                     'product_keywords': product.get('product_keywords', ''),
                     'is_active': product.get('is_active', True),
                     'brand': product.get('brand', ''),
-                    'discount_percent': int(round(float(product.get('discount_percent', 0)))),
+                    'discount_percent': _to_int_discount(product.get('discount_percent', 0)),
                     'product_type': product.get('product_type', 'Tech'),
                     'coupon_info': product.get('coupon_info', ''),
                     'category_list': product.get('category_list', ''),
@@ -599,114 +844,109 @@ def move_to_production(products_data, schema='deals_master'):
                     'updated_at': now
                 }
                 
-                print(f"🏷️ Processing product: {product_dict['product_name']}")
-                print(f"🏷️ Product promo_label: {product_dict['promo_label']}")
-                
-                # Build the upsert query (INSERT if not exists, UPDATE if exists)
-                columns = list(product_dict.keys())
-                placeholders = ', '.join(['%s'] * len(columns))
-                columns_str = ', '.join(columns)
-                
-                # Create the SET clause for UPDATE (exclude created_at and updated_at from automatic updates)
-                update_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col not in ['created_at', 'updated_at']])
+                logger.debug("Processing product: %s (promo_label: %s)", product_dict['product_name'], product_dict['promo_label'])
                 
-                upsert_query = f"""
-                    INSERT INTO {schema}.product (
-                        {columns_str}
-                    ) VALUES (
-                        {placeholders}
-                    ) 
-                    ON CONFLICT (product_key) 
-                    DO UPDATE SET 
-                        {update_clause},
-                        updated_at = EXCLUDED.updated_at
-                    RETURNING product_id
-                """
-                
-                cur.execute(upsert_query, list(product_dict.values()))
-                result = cur.fetchone()
-                if result:
-                    product_id = result[0]
-                    success_count += 1
-                    successful_product_keys.append(product_dict['product_key'])
-                    print(f"✅ Successfully moved/updated product {product_dict['product_name']} to production with ID: {product_id}")
-                    
-                    # Create initial history entry for product moved to production
-                    try:
-                        history_table = f'{schema}.product_history'
-                        hist_cols = ['product_id', 'product_key', 'product_name', 'original_price', 'deal_price', 'discount_percent', 'updated_at']
-                        hist_vals = [
-                            product_id,
-                            product_dict['product_key'],
-                            product_dict['product_name'],
-                            product_dict['original_price'],
-                            product_dict['deal_price'],
-                            product_dict['discount_percent'],
-                            product_dict['updated_at']
-                        ]
-                        
-                        cur.execute(
-                            f"INSERT INTO {history_table} ({', '.join(hist_cols)}) VALUES ({', '.join(['%s']*len(hist_cols))})",
-                            hist_vals
-                        )
-                        print(f"✅ Created initial history entry for product moved to production {product_id}")
-                    except Exception as e:
-                        print(f"⚠️ Warning: Could not create history entry for product moved to production {product_id}: {e}")
-                        # Don't fail the entire operation if history creation fails
-                else:
-                    print(f"⚠️ Product {product_dict['product_name']} was not inserted/updated")
+                columns = columns or list(product_dict.keys())
+                rows_by_key[product_dict['product_key']] = tuple(product_dict.values())
                 
             except Exception as e:
                 print(f"❌ Error moving product to production: {e}")
-                failed_products.append({
-                    "reason": str(e),
-                    "product": product.get('name', 'Unknown product')
-                })
+                failed_count += 1
+                if len(failed_products) < MAX_ERROR_DETAILS:
+                    failed_products.append({
+                        "reason": str(e),
+                        "product": product.get('name', 'Unknown product')
+                    })
         
-        # Delete successfully moved products from staging table
-        if successful_product_keys:
-            try:
-                # Build the DELETE query for staging table
-                placeholders = ', '.join(['%s'] * len(successful_product_keys))
-                delete_query = f"""
-                    DELETE FROM {schema}.product_staging 
-                    WHERE product_key IN ({placeholders})
-                """
+        # Upsert into production, write the initial history entries and delete the moved
+        # products from staging in one statement per page of products
+        success_count = 0
+        successful_product_keys = []  # Track successfully moved products
+        if rows_by_key:
+            # The statement only depends on the schema, so it is built once per schema
+            move_query = _move_sql_cache.get(schema)
+            if move_query is None:
+                columns_str = ', '.join(columns)
                 
-                cur.execute(delete_query, successful_product_keys)
-                deleted_count = cur.rowcount
-                print(f"🗑️ Deleted {deleted_count} products from staging table")
+                # Create the SET clause for UPDATE (exclude created_at and updated_at from automatic updates)
+                update_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col not in ['created_at', 'updated_at']])
                 
-            except Exception as e:
-                print(f"❌ Error deleting products from staging: {e}")
-                # Don't fail the entire operation if deletion fails
-                failed_products.append({
-                    "reason": f"Failed to delete from staging: {str(e)}",
-                    "product": "Multiple products"
-                })
+                move_query = f"""
+                    WITH moved AS (
+                        INSERT INTO {schema}.product (
+                            {columns_str}
+                        ) VALUES %s
+                        ON CONFLICT (product_key) 
+                        DO UPDATE SET 
+                            {update_clause},
+                            updated_at = EXCLUDED.updated_at
+                        RETURNING {_HIST_COLS_SQL}
+                    ), history AS (
+                        INSERT INTO {schema}.product_history ({_HIST_COLS_SQL})
+                        SELECT {_HIST_COLS_SQL} FROM moved
+                    ), removed AS (
+                        DELETE FROM {schema}.product_staging
+                        WHERE product_key IN (SELECT product_key FROM moved)
+                    )
+                    SELECT product_id, product_key FROM moved
+                """
+                _move_sql_cache[schema] = move_query
+            
+            # Each page runs under a savepoint; if it fails, only that page is rolled back and
+            # retried one product at a time so a bad row fails alone instead of the whole move
+            rows = list(rows_by_key.values())
+            name_index = columns.index('product_name')
+            for start in range(0, len(rows), 1000):
+                page = rows[start:start + 1000]
+                cur.execute("SAVEPOINT move_page")
+                try:
+                    moved_rows = execute_values(cur, move_query, page, page_size=len(page), fetch=True)
+                    cur.execute("RELEASE SAVEPOINT move_page")
+                except pg8000.DatabaseError as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT move_page")
+                    print(f"⚠️ Batch move failed, retrying {len(page)} products individually: {e}")
+                    moved_rows = []
+                    for row in page:
+                        cur.execute("SAVEPOINT move_product")
+                        try:
+                            moved_rows.extend(execute_values(cur, move_query, [row], fetch=True))
+                            cur.execute("RELEASE SAVEPOINT move_product")
+                        except pg8000.DatabaseError as e:
+                            cur.execute("ROLLBACK TO SAVEPOINT move_product")
+                            failed_count += 1
+                            if len(failed_products) < MAX_ERROR_DETAILS:
+                                failed_products.append({
+                                    "reason": str(e),
+                                    "product": row[name_index]
+                                })
+                success_count += len(moved_rows)
+                successful_product_keys.extend(row[1] for row in moved_rows)
         
         conn.commit()
+        logger.info("Moved %d/%d products to production, deleted %d from staging, %d failed",
+                    success_count, len(products_data), len(successful_product_keys), failed_count)
+        analyze_after_load(conn, cur, f"{schema}.product", success_count)
+        analyze_after_load(conn, cur, f"{schema}.product_staging", len(successful_product_keys))
         
         result_message = f"Successfully moved {success_count} out of {len(products_data)} products to production"
         if successful_product_keys:
             result_message += f" and deleted {len(successful_product_keys)} from staging"
-        if failed_products:
-            result_message += f". {len(failed_products)} products failed to move."
+        if failed_count:
+            result_message += f". {failed_count} products failed to move."
             
         return {
             "success": success_count > 0,
             "message": result_message,
             "details": {
                 "success_count": success_count,
-                "failed_count": len(failed_products),
+                "failed_count": failed_count,
                 "deleted_from_staging": len(successful_product_keys),
-                "failed_products": failed_products[:10] if len(failed_products) > 10 else failed_products
+                "failed_products": failed_products
             }
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
+        release_db_connection(conn, e)
         print(f"Error during move to production: {e}")
         return {
             "success": False,
@@ -715,16 +955,19 @@ def move_to_production(products_data, schema='deals_master'):
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
-def fetch_dropdown_options(environment='staging', schema='deals_master'):
-    """Fetch dropdown options from database tables."""
+def fetch_dropdown_options(environment='staging', schema='deals_master', refresh=False):
+    """Fetch dropdown options from database tables, cached per schema for DROPDOWN_CACHE_TTL_SECONDS."""
+    cached = _dropdown_cache.get(schema)
+    if cached and not refresh and time.monotonic() - cached[0] < DROPDOWN_CACHE_TTL_SECONDS:
+        return cached[1]
+    
     conn = None
     cur = None
     
     try:
-        conn = get_db_connection()
+        conn = get_shared_db_connection()
         if not conn:
             return {
                 "success": False,
@@ -733,36 +976,41 @@ def fetch_dropdown_options(environment='staging', schema='deals_master'):
             
         cur = conn.cursor()
         
-        # Fetch categories
-        cur.execute(f"SELECT DISTINCT category FROM {schema}.categories ORDER BY category")
-        categories = [row[0] for row in cur.fetchall()]
-        
-        # Fetch deal types
-        cur.execute(f"SELECT deal_type_id, deal_type FROM {schema}.deal_types ORDER BY deal_type")
-        deal_types = [{"id": row[0], "name": row[1]} for row in cur.fetchall()]
-        
-        # Fetch retailers
-        cur.execute(f"SELECT DISTINCT retailer FROM {schema}.retailers ORDER BY retailer")
-        retailers = [row[0] for row in cur.fetchall()]
-        
-        # Fetch product types
-        cur.execute(f"SELECT DISTINCT product_type FROM {schema}.product_types ORDER BY product_type")
-        product_types = [row[0] for row in cur.fetchall()]
-        
-        # Fetch promo labels
-        cur.execute(f"SELECT DISTINCT promo_label FROM {schema}.promo_master ORDER BY promo_label")
-        promo_labels = [row[0] for row in cur.fetchall()]
+        # Fetch categories, deal types, retailers, product types and promo labels in one
+        # round-trip; the first column says which dropdown each row belongs to.
+        # The id placeholders are typed: DISTINCT would otherwise resolve a bare NULL
+        # to text, which cannot UNION with the integer deal_type_id
+        cur.execute(f"""
+            SELECT DISTINCT 'categories' AS option_key, NULL::integer AS option_id, category::text AS option_value FROM {schema}.categories
+            UNION ALL
+            SELECT 'dealTypes', deal_type_id, deal_type::text FROM {schema}.deal_types
+            UNION ALL
+            SELECT DISTINCT 'retailers', NULL::integer, retailer::text FROM {schema}.retailers
+            UNION ALL
+            SELECT DISTINCT 'productTypes', NULL::integer, product_type::text FROM {schema}.product_types
+            UNION ALL
+            SELECT DISTINCT 'promoLabels', NULL::integer, promo_label::text FROM {schema}.promo_master
+            ORDER BY option_key, option_value
+        """)
+        options = {
+            "categories": [],
+            "dealTypes": [],
+            "retailers": [],
+            "productTypes": [],
+            "promoLabels": []
+        }
+        for option_key, option_id, option_value in cur.fetchall():
+            if option_key == 'dealTypes':
+                options[option_key].append({"id": option_id, "name": option_value})
+            else:
+                options[option_key].append(option_value)
         
-        return {
+        result = {
             "success": True,
-            "options": {
-                "categories": categories,
-                "dealTypes": deal_types,
-                "retailers": retailers,
-                "productTypes": product_types,
-                "promoLabels": promo_labels
-            }
+            "options": options
         }
+        _dropdown_cache[schema] = (time.monotonic(), result)
+        return result
         
     except Exception as e:
         print(f"Error fetching dropdown options: {e}")
@@ -773,8 +1021,26 @@ def fetch_dropdown_options(environment='staging', schema='deals_master'):
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
+        release_db_connection(conn)
+
+@lru_cache(maxsize=16)
+def _delete_sql(table_name):
+    """DELETE ... RETURNING for a schema.table name, with both parts quoted as identifiers."""
+    schema, table = table_name.split('.', 1)
+    return f"DELETE FROM {identifier(schema)}.{identifier(table)} WHERE product_id = ANY(%s) RETURNING product_id"
+
+def _bulk_insert_sql(table_name):
+    """Return the temp-table, COPY, upsert and VALUES upsert statements for a bulk import into table_name."""
+    statements = _bulk_sql_cache.get(table_name)
+    if statements is None:
+        statements = (
+            f"CREATE TEMP TABLE staging_tmp ON COMMIT DROP AS SELECT {_COLUMNS_STR} FROM {table_name} WITH NO DATA",
+            f"COPY staging_tmp ({_COLUMNS_STR}) FROM STDIN",
+            _BULK_UPSERT_TMPL.format(table_name=table_name, source=f"SELECT {_BULK_SELECT} FROM staging_tmp"),
+            _BULK_UPSERT_TMPL.format(table_name=table_name, source="VALUES %s"),
+        )
+        _bulk_sql_cache[table_name] = statements
+    return statements
 
 def bulk_insert_products(products_data, table_name):
     """Bulk insert products with upsert logic using a single SQL statement."""
@@ -788,7 +1054,7 @@ def bulk_insert_products(products_data, table_name):
     cur = None
     
     try:
-        conn = get_db_connection()
+        conn = get_shared_db_connection()
         if not conn:
             return {
                 "success": False,
@@ -797,142 +1063,30 @@ def bulk_insert_products(products_data, table_name):
             
         cur = conn.cursor()
         
-        # Map of frontend field names to database column names
-        # Based on actual product_staging table columns
-        field_mapping = {
-            'product_name': 'product_name',
-            'description': 'description',
-            'deal_price': 'deal_price',
-            'original_price': 'original_price',
-            'image_url': 'image_url',
-            'image_url_1': 'image_url_1',
-            'image_url_2': 'image_url_2', 
-            'image_url_3': 'image_url_3',
-            'category': 'category',
-            'deal_type': 'deal_type',
-            'retailer': 'retailer',
-            'sale_url': 'sale_url',
-            'product_key': 'product_key',
-            'product_rating': 'product_rating',
-            'product_keywords': 'product_keywords',
-            'is_active': 'is_active',
-            'deal_type_id': 'deal_type_id',
-            'brand': 'brand',
-            'discount_percent': 'discount_percent',
-            'product_type': 'product_type',
-            'coupon_info': 'coupon_info',
-            'category_list': 'category_list',
-            'start_date': 'start_date',
-            'end_date': 'end_date',
-            'promo_label': 'promo_label',
-            'stock_status': 'stock_status'
-            # Note: Excluded columns that are auto-generated or not provided by CSV:
-            # product_id, category_id, seller_id, ts_vector, wix_id, owner, embedding, 
-            # iscount_percent, source_product_id
-        }
         
         # Prepare data for bulk insert
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         all_values = []
-        inserted_count = 0
-        updated_count = 0
         error_count = 0
-        error_details = []
-        
-        # First, get all existing product_keys to determine which are updates vs inserts
-        product_keys = []
-        for product in products_data:
-            if 'product_key' in product and product['product_key']:
-                product_keys.append(product['product_key'])
-        
-        existing_keys = set()
-        if product_keys:
-            # Query existing product_keys in batches to avoid parameter limits
-            batch_size = 1000
-            for i in range(0, len(product_keys), batch_size):
-                batch_keys = product_keys[i:i + batch_size]
-                placeholders = ','.join(['%s'] * len(batch_keys))
-                cur.execute(f"SELECT product_key FROM {table_name} WHERE product_key IN ({placeholders})", batch_keys)
-                existing_keys.update(row[0] for row in cur.fetchall())
+        error_details = []  # first MAX_ERROR_DETAILS failures only
         
         # Process each product and prepare values
         for i, product in enumerate(products_data):
             try:
-                # Prepare values for this product - use timestamps from product data if available
-                created_at = product.get('created_at', now)
-                updated_at = product.get('updated_at', now)
-                values = [created_at, updated_at]  # created_at, updated_at
-                
-                # Add product fields in the same order as field_mapping
-                for frontend_field, db_field in field_mapping.items():
-                    if frontend_field in product and frontend_field not in ['created_at', 'updated_at']:
-                        # Handle special cases
-                        if db_field in ('start_date', 'end_date') and product[frontend_field] == '':
-                            values.append(None)
-                        elif db_field == 'discount_percent':
-                            try:
-                                discount_value = float(product[frontend_field]) if product[frontend_field] and product[frontend_field] != '' else 0
-                                values.append(int(round(discount_value)))
-                            except (ValueError, TypeError):
-                                values.append(0)
-                        elif db_field == 'deal_type_id':
-                            # Use deal_type from Import Configuration, default to 2
-                            deal_type_value = product.get('deal_type', 'Hot Deal')
-                            # Map deal_type text to deal_type_id
-                            if deal_type_value.lower() in ['hot deal', 'hotdeal']:
-                                values.append(1)
-                            elif deal_type_value.lower() in ['sale', 'clearance', 'discount']:
-                                values.append(2)
-                            else:
-                                values.append(2)  # Default to 2 for unknown types
-                        elif db_field == 'product_rating':
-                            try:
-                                rating_value = float(product[frontend_field]) if product[frontend_field] and product[frontend_field] != '' else 4.5
-                                values.append(rating_value)
-                            except (ValueError, TypeError):
-                                values.append(4.5)
-                        elif db_field in ('product_name', 'description'):
-                            values.append(clean_text_field(product[frontend_field]))
-                        else:
-                            values.append(product[frontend_field])
-                    else:
-                        # Add default values for missing fields
-                        if db_field == 'discount_percent':
-                            values.append(0)
-                        elif db_field == 'deal_type_id':
-                            # Use deal_type from Import Configuration, default to 2
-                            deal_type_value = product.get('deal_type', 'Hot Deal')
-                            # Map deal_type text to deal_type_id
-                            if deal_type_value.lower() in ['hot deal', 'hotdeal']:
-                                values.append(1)
-                            elif deal_type_value.lower() in ['sale', 'clearance', 'discount']:
-                                values.append(2)
-                            else:
-                                values.append(2)  # Default to 2 for unknown types
-                        elif db_field == 'product_rating':
-                            values.append(4.5)
-                        elif db_field in ('start_date', 'end_date'):
-                            values.append(None)
-                        else:
-                            values.append('')
+                # Use timestamps from product data if available (NOW() otherwise), then one transform per mapped field
+                values = [product.get('created_at'), product.get('updated_at')]
+                values.extend([transform(product) for transform in _ROW_TRANSFORMS])
                 
                 all_values.append(values)
-                
-                # Track whether this will be an insert or update
-                product_key = product.get('product_key')
-                if product_key and product_key in existing_keys:
-                    updated_count += 1
-                else:
-                    inserted_count += 1
                     
             except Exception as e:
                 error_count += 1
-                error_details.append({
-                    'row': i + 1,
-                    'product_key': product.get('product_key', 'unknown'),
-                    'errors': [str(e)]
-                })
-                print(f"Error preparing product {i + 1}: {e}")
+                if len(error_details) < MAX_ERROR_DETAILS:
+                    error_details.append({
+                        'row': i + 1,
+                        'product_key': product.get('product_key', 'unknown'),
+                        'errors': [str(e)]
+                    })
+                logger.debug("Error preparing product %d: %s", i + 1, e)
         
         if not all_values:
             return {
@@ -947,49 +1101,52 @@ def bulk_insert_products(products_data, table_name):
                 }
             }
         
-        # Build the bulk upsert query
-        columns = ['created_at', 'updated_at'] + list(field_mapping.values())
-        columns_str = ', '.join(columns)
-        placeholders = ', '.join(['%s'] * len(columns))
+        # Use PostgreSQL's ON CONFLICT for upsert, merging from the COPY-loaded temp table
+        create_tmp_query, copy_query, upsert_query, values_upsert_query = _bulk_insert_sql(table_name)
         
-        # Create the SET clause for UPDATE (exclude created_at, updated_at, and product_id from updates)
-        update_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col not in ['created_at', 'updated_at', 'product_id']])
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Bulk upsert query: %s", upsert_query)
+            logger.debug("Sample values (first product): %s", all_values[0] if all_values else 'No values')
+            # Check for empty strings in numeric fields
+            if all_values:
+                for i, (col, val) in enumerate(zip(_COLUMNS, all_values[0])):
+                    if col in ['discount_percent', 'product_rating', 'deal_type_id'] and val == '':
+                        logger.debug("Empty string found in numeric field %s at position %d", col, i)
         
-        # Use PostgreSQL's ON CONFLICT for upsert
-        upsert_query = f"""
-            INSERT INTO {table_name} (
-                {columns_str}
-            ) VALUES (
-                {placeholders}
-            ) 
-            ON CONFLICT (product_key) 
-            DO UPDATE SET 
-                {update_clause},
-                updated_at = EXCLUDED.updated_at
-        """
+        # A set-based upsert cannot touch the same product_key twice, so keep only the last
+        # occurrence of each key (what row-by-row execution would have left in the table)
+        key_index = _COLUMNS.index('product_key')
+        last_by_key = {}
+        for row_number, values in enumerate(all_values):
+            product_key = values[key_index]
+            last_by_key[row_number if product_key is None else product_key] = values
+        upsert_rows = list(last_by_key.values())
         
-        print(f"Executing bulk upsert for {len(all_values)} products")
-        print(f"Query: {upsert_query}")
-        print(f"Sample values (first product): {all_values[0] if all_values else 'No values'}")
-        print(f"Columns: {columns}")
-        print(f"Column count: {len(columns)}, Values count: {len(all_values[0]) if all_values else 0}")
-        
-        # Debug: Check for empty strings in numeric fields
-        if all_values:
-            for i, (col, val) in enumerate(zip(columns, all_values[0])):
-                if col in ['discount_percent', 'product_rating', 'deal_type_id'] and val == '':
-                    print(f"WARNING: Empty string found in numeric field {col} at position {i}: '{val}'")
-        
-        # Execute the bulk insert
+        # Execute the bulk insert: small imports upsert with one multi-row INSERT ... VALUES;
+        # larger ones stream all rows into a temp table with COPY (no per-row statement
+        # parsing), then merge into the target table with one upsert
         try:
-            cur.executemany(upsert_query, all_values)
+            if len(upsert_rows) < BULK_COPY_MIN_ROWS:
+                inserted_count, updated_count = execute_values(
+                    cur, values_upsert_query, upsert_rows,
+                    template=_BULK_VALUES_ROW, page_size=BULK_COPY_MIN_ROWS, fetch=True
+                )[0]
+            else:
+                cur.execute(create_tmp_query)
+                cur.execute(copy_query, stream=_copy_chunks(upsert_rows))
+                cur.execute(upsert_query)
+                inserted_count, updated_count = cur.fetchone()
             conn.commit()
-            print(f"✅ Bulk upsert completed: {inserted_count} new, {updated_count} updated, {error_count} errors")
+            logger.info("Bulk upsert of %d products completed: %d new, %d updated, %d errors",
+                        len(all_values), inserted_count, updated_count, error_count)
         except Exception as db_error:
             print(f"❌ Database error during bulk upsert: {db_error}")
             conn.rollback()
             raise db_error
         
+        # Keep staging statistics current so the next batch and the production move plan well
+        analyze_after_load(conn, cur, table_name, len(upsert_rows))
+        
         return {
             "success": True,
             "message": f'Bulk import completed: {inserted_count} inserted, {updated_count} updated, {error_count} errors',
@@ -998,13 +1155,12 @@ def bulk_insert_products(products_data, table_name):
                 'inserted': inserted_count,
                 'updated': updated_count,
                 'errors': error_count,
-                'error_details': error_details[:10] if len(error_details) > 10 else error_details
+                'error_details': error_details
             }
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
+        release_db_connection(conn, e)
         print(f"Error during bulk insert: {e}")
         return {
             "success": False,
@@ -1020,8 +1176,7 @@ def bulk_insert_products(products_data, table_name):
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 def add_promo_label(promo_label, schema='deals_master'):
     """Add a new promo label to the database."""
@@ -1029,7 +1184,7 @@ def add_promo_label(promo_label, schema='deals_master'):
     cur = None
     
     try:
-        conn = get_db_connection()
+        conn = get_shared_db_connection()
         if not conn:
             return {
                 "success": False,
@@ -1039,21 +1194,27 @@ def add_promo_label(promo_label, schema='deals_master'):
             
         cur = conn.cursor()
         
-        # Check if promo label already exists
-        cur.execute(f"SELECT promo_label FROM {schema}.promo_master WHERE promo_label = %s", (promo_label,))
-        if cur.fetchone():
+        # Insert the promo label unless it already exists, in one statement; RETURNING
+        # yields no row when the label was already there. The unique index
+        # promo_master_promo_label_key (created by the promo schema migration)
+        # makes this safe against concurrent adds of the same label
+        cur.execute(
+            f"""
+            INSERT INTO {schema}.promo_master (promo_label, is_active, created_at, updated_at)
+            VALUES (%s, TRUE, NOW(), NOW())
+            ON CONFLICT (promo_label) DO NOTHING
+            RETURNING promo_label
+            """,
+            (promo_label,)
+        )
+        inserted = cur.fetchone()
+        conn.commit()
+        if inserted is None:
             return {
                 "success": False,
                 "message": f"Promo label '{promo_label}' already exists"
             }
-        
-        # Insert new promo label
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cur.execute(
-            f"INSERT INTO {schema}.promo_master (promo_label, is_active, created_at, updated_at) VALUES (%s, %s, %s, %s)",
-            (promo_label, True, now, now)
-        )
-        conn.commit()
+        _dropdown_cache.pop(schema, None)  # promoLabels changed
         
         return {
             "success": True,
@@ -1061,8 +1222,7 @@ def add_promo_label(promo_label, schema='deals_master'):
         }
         
     except Exception as e:
-        if conn:
-            conn.rollback()
+        release_db_connection(conn, e)
         print(f"Error adding promo label: {e}")
         return {
             "success": False,
@@ -1071,27 +1231,174 @@ def add_promo_label(promo_label, schema='deals_master'):
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
+        release_db_connection(conn)
+
+def _handle_update_data(body, schema, environment, table_name):
+    """Insert a new product (no id given) or update existing products."""
+    # Check if this is a new product insertion (no ID provided)
+    if 'id' not in body and body.get('product_name'):
+        # This is a new product insertion
+        print(f"Inserting new product in {table_name}")
+        result = insert_product(body, table_name)
+    else:
+        # This is an update to existing products
+        products = body.get('products', [])
+        
+        if not products or not isinstance(products, list):
+            # Check if we have a single product in the body
+            if body.get('product_name'):
+                # Create a list with the single product
+                products = [{'id': body.get('id'), **body}]
+            else:
+                return 400, _NO_UPDATE_PRODUCTS_BODY
+        
+        print(f"Updating {len(products)} products in {table_name}")
+        result = update_products(products, table_name)
+    
+    # Return with 200 status if the operation was successful
+    return 200, result
+
+def _handle_move_to_production(body, schema, environment, table_name):
+    """Move products from staging to production."""
+    products_data = body.get('products', [])
+    if not products_data:
+        # Try the old format for backward compatibility
+        product_ids = body.get('productIds', [])
+        if not product_ids:
+            return 400, _NO_MOVE_PRODUCTS_BODY
+        # Handle old format - would need to fetch products from staging first
+        return 400, _MOVE_NEEDS_PRODUCT_DATA_BODY
+        
+    print(f"🏷️ Moving {len(products_data)} products to production")
+    result = move_to_production(products_data, schema)
+    
+    return (200 if result.get('success', False) else 400), result
+
+def _handle_fetch_options(body, schema, environment, table_name):
+    """Fetch dropdown options."""
+    print(f"Fetching dropdown options for environment: {environment}")
+    result = fetch_dropdown_options(environment, schema, refresh=bool(body.get('refresh')))
+    
+    return (200 if result.get('success', False) else 400), result
+
+def _handle_add_promo_label(body, schema, environment, table_name):
+    """Add a new promo label."""
+    promo_label = body.get('promo_label')
+    if not promo_label:
+        return 400, _MISSING_PROMO_LABEL_BODY
+    
+    print(f"Adding new promo label: {promo_label}")
+    result = add_promo_label(promo_label, schema)
+    
+    return (200 if result.get('success', False) else 400), result
+
+def _handle_bulk_insert(body, schema, environment, table_name):
+    """Bulk insert products (for CSV import)."""
+    products_data = body.get('products', [])
+    if not products_data or not isinstance(products_data, list):
+        return 400, _NO_BULK_PRODUCTS_BODY
+    
+    print(f"Bulk inserting {len(products_data)} products into {table_name}")
+    
+    # Use bulk insert with upsert logic
+    result = bulk_insert_products(products_data, table_name)
+    
+    return (200 if result.get('success', False) else 400), {
+        'success': result.get('success', False),
+        'message': result.get('message', 'Bulk import completed'),
+        'results': result.get('results', {}),
+        'environment': environment,
+        'schema': schema
+    }
+
+def _handle_delete_products(body, schema, environment, table_name):
+    """Delete products by product_id."""
+    product_ids = body.get('product_ids', [])
+    if not product_ids or not isinstance(product_ids, list):
+        return 400, _NO_PRODUCT_IDS_BODY
+    # product_id is text; accept str or int IDs only and normalize them to str so 1 and "1" match
+    if not all(isinstance(pid, (str, int)) and not isinstance(pid, bool) for pid in product_ids):
+        return 400, _INVALID_PRODUCT_ID_BODY
+    # Drop repeated IDs (keeping the first occurrence) and bound the batch size
+    product_ids = list(dict.fromkeys(str(pid) for pid in product_ids))
+    if len(product_ids) > MAX_DELETE_IDS:
+        return 400, _TOO_MANY_PRODUCT_IDS_BODY
+    
+    # Validation above never touches the database
+    conn = get_shared_db_connection()
+    if not conn:
+        return 500, _DB_CONNECTION_FAILED_BODY
+    
+    try:
+        with db_cursor(conn) as cur:
+            # Delete and report what was deleted with DELETE ... RETURNING; the IDs are bound as
+            # one array parameter so the query text is the same for any number of IDs. A single
+            # statement is atomic on its own, so it runs in autocommit mode and skips the
+            # separate BEGIN and COMMIT round-trips pg8000 would otherwise send around it;
+            # larger batches are deleted DELETE_CHUNK_SIZE IDs at a time in one transaction
+            delete_query = _delete_sql(table_name)
+            single_statement = len(product_ids) <= DELETE_CHUNK_SIZE
+            conn.autocommit = single_statement
+            try:
+                deleted_products = []
+                for i in range(0, len(product_ids), DELETE_CHUNK_SIZE):
+                    cur.execute(delete_query, (product_ids[i:i + DELETE_CHUNK_SIZE],))
+                    deleted_products.extend(cur.fetchall())
+                if not single_statement:
+                    # End the chunked transaction before autocommit is switched back below
+                    if deleted_products:
+                        conn.commit()
+                    else:
+                        conn.rollback()
+            finally:
+                conn.autocommit = False
+    except Exception as e:
+        print(f"Error executing delete query: {e}")
+        return 500, {
+            'success': False,
+            'message': f'Database delete error: {str(e)}',
+            'table': table_name
+        }
+    
+    if not deleted_products:
+        # No matching products: 404 with an empty body rather than echoing the ID list back
+        return 404, ''
+    
+    # RETURNING gives the exact rows deleted, so the count and IDs need no extra query
+    deleted_count = len(deleted_products)
+    
+    return 200, {
+        'success': True,
+        'message': f'Successfully deleted {deleted_count} products',
+        'deleted_count': deleted_count,
+        'deleted_ids': [row[0] for row in deleted_products],
+        'environment': environment
+    }
+
+# operation name -> handler(body, schema, environment, table_name) returning (status_code, payload)
+OPERATIONS = {
+    'update_data': _handle_update_data,
+    'move_to_production': _handle_move_to_production,
+    'fetch_options': _handle_fetch_options,
+    'add_promo_label': _handle_add_promo_label,
+    'bulk_insert': _handle_bulk_insert,
+    'delete_products': _handle_delete_products,
+}
 
 def lambda_handler(event, context):
     """Handler for the Lambda function."""
-    print("Event received:", json.dumps(event, default=str))
+    # The event carries the whole request payload (thousands of products for bulk imports),
+    # so it is only serialized for the log when DEBUG logging is on
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Event received: %s", _json_dumps(event))
+    else:
+        print(f"Event received: httpMethod={event.get('httpMethod')}, body length={len(event.get('body') or '')}")
     print(f"Lambda timeout: {context.get_remaining_time_in_millis()}ms")
     print(f"Lambda memory: {context.memory_limit_in_mb}MB")
     
     # Handle CORS preflight requests
     if event.get('httpMethod') == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return _response(200, '', preflight=True)
     
     # Only try to parse body for non-OPTIONS requests
     try:
@@ -1104,21 +1411,9 @@ def lambda_handler(event, context):
                 body_content = event['body']
                 if isinstance(body_content, str):
                     try:
-                        body = json.loads(body_content)
+                        body = _json_loads(body_content)
                     except json.JSONDecodeError:
-                        return {
-                            'statusCode': 400,
-                            'headers': {
-                                'Content-Type': 'application/json',
-                                'Access-Control-Allow-Origin': '*',
-                                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                            },
-                            'body': json.dumps({
-                                'success': False,
-                                'message': "Invalid JSON in request body"
-                            })
-                        }
+                        return _response(400, _INVALID_JSON_BODY)
                 else:
                     body = body_content  # Already parsed JSON
             else:
@@ -1126,30 +1421,18 @@ def lambda_handler(event, context):
                 body = event
         
         if not body or not isinstance(body, dict):
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                },
-                'body': json.dumps({
-                    'success': False,
-                    'message': "Missing or invalid request body"
-                })
-            }
+            return _response(400, _MISSING_BODY_BODY)
         
         # Extract operation type, environment, country, and schema
         operation = body.get('operation', 'update_data')
         environment = body.get('environment', 'staging')
-        country = body.get('country', os.environ.get('COUNTRY', 'US')).upper()
+        country = body.get('country', CONFIG['country']).upper()
         schema = body.get('schema', None)
         
         # Determine schema based on country if not explicitly provided
         if not schema:
-            # Try to get from environment variables first
-            schema = os.environ.get('SCHEMA', None)
+            # Try the deployment's SCHEMA first
+            schema = CONFIG['schema']
             if not schema:
                 if country == 'INDIA':
                     schema = 'deals_india'
@@ -1166,319 +1449,24 @@ def lambda_handler(event, context):
             table_name = f'{schema}.product_staging' if environment == 'staging' else f'{schema}.product'
         
         # Process based on operation type
-        if operation == 'update_data':
-            # Check if this is a new product insertion (no ID provided)
-            if 'id' not in body and body.get('product_name'):
-                # This is a new product insertion
-                print(f"Inserting new product in {table_name}")
-                result = insert_product(body, table_name)
-            else:
-                # This is an update to existing products
-                products = body.get('products', [])
-                
-                if not products or not isinstance(products, list):
-                    # Check if we have a single product in the body
-                    if body.get('product_name'):
-                        # Create a list with the single product
-                        products = [{'id': body.get('id'), **body}]
-                    else:
-                        return {
-                            'statusCode': 400,
-                            'headers': {
-                                'Content-Type': 'application/json',
-                                'Access-Control-Allow-Origin': '*',
-                                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                            },
-                            'body': json.dumps({
-                                'success': False,
-                                'message': "No products provided for update"
-                            })
-                        }
-                
-                print(f"Updating {len(products)} products in {table_name}")
-                result = update_products(products, table_name)
-            
-            # Return with 200 status if the operation was successful
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                },
-                'body': json.dumps(result)
-            }
-        elif operation == 'move_to_production':
-            # Handle moving products from staging to production
-            products_data = body.get('products', [])
-            if not products_data:
-                # Try the old format for backward compatibility
-                product_ids = body.get('productIds', [])
-                if not product_ids:
-                    return {
-                        'statusCode': 400,
-                        'headers': {
-                            'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*',
-                            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                        },
-                        'body': json.dumps({
-                            'success': False,
-                            'message': "No products or product IDs provided for move to production"
-                        })
-                    }
-                # Handle old format - would need to fetch products from staging first
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                    },
-                    'body': json.dumps({
-                        'success': False,
-                        'message': "Please provide complete product data for move to production"
-                    })
-                }
-                
-            print(f"🏷️ Moving {len(products_data)} products to production")
-            result = move_to_production(products_data, schema)
-            
-            return {
-                'statusCode': 200 if result.get('success', False) else 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                },
-                'body': json.dumps(result)
-            }
-        elif operation == 'fetch_options':
-            # Handle fetching dropdown options
-            environment = body.get('environment', 'staging')
-            print(f"Fetching dropdown options for environment: {environment}")
-            result = fetch_dropdown_options(environment, schema)
-            
-            return {
-                'statusCode': 200 if result.get('success', False) else 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                },
-                'body': json.dumps(result)
-            }
-        elif operation == 'add_promo_label':
-            # Handle adding a new promo label
-            promo_label = body.get('promo_label')
-            if not promo_label:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                    },
-                    'body': json.dumps({
-                        'success': False,
-                        'message': "Missing promo label in request body"
-                    })
-                }
-            
-            print(f"Adding new promo label: {promo_label}")
-            result = add_promo_label(promo_label, schema)
-            
-            return {
-                'statusCode': 200 if result.get('success', False) else 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                },
-                'body': json.dumps(result)
-            }
-        elif operation == 'bulk_insert':
-            # Handle bulk insertion of products (for CSV import)
-            products_data = body.get('products', [])
-            if not products_data or not isinstance(products_data, list):
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                    },
-                    'body': json.dumps({
-                        'success': False,
-                        'message': "No products provided for bulk insertion"
-                    })
-                }
-            
-            print(f"Bulk inserting {len(products_data)} products into {table_name}")
-            
-            # Use bulk insert with upsert logic
-            result = bulk_insert_products(products_data, table_name)
-            
-            return {
-                'statusCode': 200 if result.get('success', False) else 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                },
-                'body': json.dumps({
-                    'success': result.get('success', False),
-                    'message': result.get('message', 'Bulk import completed'),
-                    'results': result.get('results', {}),
-                    'environment': environment,
-                    'schema': schema
-                })
-            }
-        elif operation == 'delete_products':
-            # Handle deleting products
-            product_ids = body.get('product_ids', [])
-            if not product_ids or not isinstance(product_ids, list):
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                    },
-                    'body': json.dumps({
-                        'success': False,
-                        'message': "No product IDs provided or invalid format"
-                    })
-                }
-            
-            try:
-                conn = get_db_connection()
-                if not conn:
-                    return {
-                        'statusCode': 500,
-                        'headers': {
-                            'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*',
-                            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                        },
-                        'body': json.dumps({
-                            'success': False,
-                            'message': "Database connection failed"
-                        })
-                    }
-                
-                cur = conn.cursor()
-                
-                # First, check what products exist with these IDs
-                check_placeholders = ','.join(['%s'] * len(product_ids))
-                check_query = f"SELECT product_id, product_name FROM {table_name} WHERE product_id IN ({check_placeholders})"
-                
-                cur.execute(check_query, product_ids)
-                existing_products = cur.fetchall()
-                
-                if not existing_products:
-                    return {
-                        'statusCode': 400,
-                        'headers': {
-                            'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*',
-                            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                        },
-                        'body': json.dumps({
-                            'success': False,
-                            'message': 'No products found with the provided IDs',
-                            'product_ids_received': product_ids,
-                            'table': table_name
-                        })
-                    }
-                
-                # Now proceed with deletion
-                placeholders = ','.join(['%s'] * len(product_ids))
-                delete_query = f"DELETE FROM {table_name} WHERE product_id IN ({placeholders})"
-                
-                cur.execute(delete_query, product_ids)
-                deleted_count = cur.rowcount
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                    },
-                    'body': json.dumps({
-                        'success': True,
-                        'message': f'Successfully deleted {deleted_count} products',
-                        'deleted_count': deleted_count,
-                        'environment': environment
-                    })
-                }
-                
-            except Exception as e:
-                print(f"Error executing delete query: {e}")
-                if conn:
-                    conn.rollback()
-                return {
-                    'statusCode': 500,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                    },
-                    'body': json.dumps({
-                        'success': False,
-                        'message': f'Database delete error: {str(e)}',
-                        'table': table_name
-                    })
-                }
-            finally:
-                if cur:
-                    cur.close()
-                if conn:
-                    conn.close()
-        else:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                    'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-                },
-                'body': json.dumps({
-                    'success': False,
-                    'message': f"Unsupported operation: {operation}"
-                })
-            }
+        handler = OPERATIONS.get(operation)
+        if handler is None:
+            return _response(400, {
+                'success': False,
+                'message': f"Unsupported operation: {operation}"
+            })
+        return _response(*handler(body, schema, environment, table_name))
         
     except Exception as e:
         print(f"Error in lambda_handler: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Requested-With',
-                'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
-            },
-            'body': json.dumps({
-                'success': False,
-                'message': f"Error processing request: {str(e)}"
-            })
-        } 
\ No newline at end of file
+        if isinstance(e, pg8000.InterfaceError):
+            reset_db_connection()
+        return _response(500, {
+            'success': False,
+            'message': f"Error processing request: {str(e)}"
+        })
+
+# Open the shared connection during the Lambda INIT phase so the first invocation does not
+# pay for the TCP/TLS/auth handshake (skipped outside Lambda, e.g. when imported by scripts)
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    get_shared_db_connection()
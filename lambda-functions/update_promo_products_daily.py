@@ -1,486 +1,502 @@
 import json
+import logging
 import os
 import datetime
 import pg8000
+from pg8000.native import identifier
 import boto3
 
+# Step traces are DEBUG, outcomes INFO; production runs at WARNING unless LOG_LEVEL says otherwise
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'WARNING').upper())
+
 # Database configuration (env fallback when not using Secrets Manager)
 DB_HOST = os.environ.get('DB_HOST')
 DB_NAME = os.environ.get('DB_NAME')
 DB_USER = os.environ.get('DB_USER')
 DB_PASSWORD = os.environ.get('DB_PASSWORD')
 
-# Schema mapping for different countries
+# Schema mapping for different countries (keys are lowercase; lookups are case-insensitive)
 SCHEMA_MAPPING = {
     'us': 'deals_master',
     'usa': 'deals_master',
     'united_states': 'deals_master',
     'in': 'deals_india',
-    'IN': 'deals_india',
-    'india': 'deals_india',
-    'INDIA': 'deals_india'
+    'india': 'deals_india'
 }
+_NORMALIZED_SCHEMA_MAPPING = {k.lower(): v for k, v in SCHEMA_MAPPING.items()}
 
-def get_db_connection():
+# Candidate counts scan product twice and are only diagnostic; PROMO_DEBUG=1 enables them
+PROMO_DEBUG = os.environ.get('PROMO_DEBUG') == '1'
+
+# Columns of product that the promo update reads or writes
+REQUIRED_PRODUCT_COLUMNS = frozenset((
+    'product_id', 'product_name', 'deal_price', 'original_price',
+    'discount_percent', 'is_active', 'promo_label', 'updated_at'
+))
+
+# Reused across warm invocations of the same container
+_secrets_client = None
+_db_credentials_cache = None
+_db_connection = None
+
+# Schemas already verified in this container; warm invocations skip the catalog checks
+_schema_verified_cache = set()
+
+# product_promo_history, its indexes and run_daily_promo_update are created at
+# deploy time by migrate_handler (a CDK trigger), never on the update path
+PROMO_HISTORY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {schema}.product_promo_history (
+        id SERIAL PRIMARY KEY,
+        product_id VARCHAR(255) NOT NULL,
+        promo_label VARCHAR(100) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    )
+"""
+
+# Indexes backing the promo queries: the partial index covers the candidate
+# predicate of both picks (ordered by updated_at), the label index serves the
+# clears, and the history index serves the 7-day lookback. Keyed by index name
+# so apply_promo_migrations can rebuild any left INVALID by a failed build
+PROMO_INDEX_SQL = {
+    'product_promo_updated_idx': """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS product_promo_updated_idx
+        ON {schema}.product (updated_at DESC)
+        WHERE is_active = true AND deal_price > 25 AND discount_percent > 25""",
+    'product_promo_label_idx': """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS product_promo_label_idx
+        ON {schema}.product (promo_label)
+        WHERE promo_label IN ('deal_of_the_day', 'deals_now_pick')""",
+    'product_promo_history_recent_idx': """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS product_promo_history_recent_idx
+        ON {schema}.product_promo_history (created_at DESC, product_id)""",
+}
+
+# Backs ON CONFLICT (promo_label) in update_product_data.add_promo_label. Only
+# built where the schema has its own promo_master (India may fall back to deals_master's)
+PROMO_MASTER_INDEX_SQL = {
+    'promo_master_promo_label_key': """
+        CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS promo_master_promo_label_key
+        ON {schema}.promo_master (promo_label)""",
+}
+
+INVALID_PROMO_INDEXES_SQL = """
+    SELECT c.relname::text
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relnamespace = to_regnamespace(%s::text)
+    AND c.relname::text = ANY(%s::text[])
+    AND NOT i.indisvalid
+"""
+
+# Server-side daily promo update: clears the previous picks, picks the deal of
+# the day and three deals_now_pick, and records them in product_promo_history,
+# all inside Postgres so run_update needs a single round-trip.
+# Every timestamp is NOW(), i.e. the transaction start time, so all rows
+# touched by one run share it; history rows take it from the column default.
+# The 7-day pick history (and, when requested, the candidate counts) are read
+# before the clears.
+# Names are unqualified: the function is created in, and resolves its tables
+# against, the schema set by set_schema_search_path.
+PROMO_UPDATE_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION run_daily_promo_update(include_candidate_counts boolean DEFAULT false)
+    RETURNS TABLE (
+        cleared_deal_of_the_day bigint,
+        cleared_deals_now_pick bigint,
+        previously_picked_count integer,
+        deal_of_day_candidates bigint,
+        deals_now_pick_candidates bigint,
+        deal_of_the_day json,
+        deals_now_pick json
+    )
+    LANGUAGE plpgsql
+    AS $fn$
+    DECLARE
+        -- History stores product_id as VARCHAR; product's key is compared as text
+        -- so the filter works whatever type product.product_id has
+        picked text[];
+    BEGIN
+        picked := ARRAY(
+            SELECT DISTINCT h.product_id
+            FROM product_promo_history h
+            WHERE h.created_at >= NOW() - INTERVAL '7 days'
+        );
+        previously_picked_count := cardinality(picked);
+
+        IF include_candidate_counts THEN
+            SELECT COUNT(*) INTO deal_of_day_candidates
+            FROM product p
+            WHERE p.is_active = true
+            AND p.deal_price > 36
+            AND p.discount_percent > 30
+            AND p.promo_label != 'deal_of_the_day';
+
+            SELECT COUNT(*) INTO deals_now_pick_candidates
+            FROM product p
+            WHERE p.is_active = true
+            AND p.deal_price > 27
+            AND p.discount_percent > 27
+            AND p.promo_label != 'deals_now_pick';
+        END IF;
+
+        WITH cleared AS (
+            UPDATE product p
+            SET promo_label = '',
+                deal_type_id = 1,
+                updated_at = NOW()
+            WHERE p.promo_label = 'deal_of_the_day'
+            RETURNING 1
+        )
+        SELECT COUNT(*) INTO cleared_deal_of_the_day FROM cleared;
+
+        WITH cleared AS (
+            UPDATE product p
+            SET promo_label = '',
+                deal_type_id = 1,
+                updated_at = NOW()
+            WHERE p.promo_label = 'deals_now_pick'
+            RETURNING 1
+        )
+        SELECT COUNT(*) INTO cleared_deals_now_pick FROM cleared;
+
+        -- Requirements: discount_percent > 27% and deal_price > $36
+        WITH candidate AS (
+            SELECT p.product_id
+            FROM product p
+            WHERE p.is_active = true
+            AND p.deal_price > 36
+            AND p.discount_percent > 27
+            AND p.promo_label NOT IN ('deal_of_the_day', 'deals_now_pick')
+            AND p.product_id::text <> ALL(picked)
+            ORDER BY p.updated_at DESC
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        ),
+        updated AS (
+            UPDATE product p
+            SET promo_label = 'deal_of_the_day',
+                deal_type_id = 1,
+                updated_at = NOW()
+            FROM candidate
+            WHERE p.product_id = candidate.product_id
+            RETURNING p.product_id, p.product_name, p.deal_price, p.original_price, p.discount_percent
+        ),
+        recorded AS (
+            INSERT INTO product_promo_history (product_id, promo_label)
+            SELECT u.product_id, 'deal_of_the_day' FROM updated u
+        )
+        SELECT json_build_object(
+            'product_id', u.product_id,
+            'product_name', u.product_name,
+            'deal_price', u.deal_price,
+            'original_price', u.original_price,
+            'discount_percent', u.discount_percent
+        )
+        INTO deal_of_the_day
+        FROM updated u;
+
+        -- Runs after the deal of the day in the same transaction, so that pick
+        -- is already labelled and excluded here; keep the two steps sequential.
+        -- Requirements: discount_percent > 25% and deal_price > $25
+        WITH candidate AS (
+            SELECT p.product_id, p.updated_at AS previous_updated_at
+            FROM product p
+            WHERE p.is_active = true
+            AND p.deal_price > 25
+            AND p.discount_percent > 25
+            AND p.promo_label NOT IN ('deal_of_the_day', 'deals_now_pick')
+            AND p.product_id::text <> ALL(picked)
+            ORDER BY p.updated_at DESC
+            LIMIT 3
+            FOR UPDATE SKIP LOCKED
+        ),
+        updated AS (
+            UPDATE product p
+            SET promo_label = 'deals_now_pick',
+                updated_at = NOW()
+            FROM candidate
+            WHERE p.product_id = candidate.product_id
+            RETURNING p.product_id, p.product_name, p.deal_price, p.original_price, p.discount_percent,
+                      candidate.previous_updated_at
+        ),
+        recorded AS (
+            INSERT INTO product_promo_history (product_id, promo_label)
+            SELECT u.product_id, 'deals_now_pick' FROM updated u
+        )
+        SELECT COALESCE(json_agg(json_build_object(
+            'product_id', u.product_id,
+            'product_name', u.product_name,
+            'deal_price', u.deal_price,
+            'original_price', u.original_price,
+            'discount_percent', u.discount_percent
+        ) ORDER BY u.previous_updated_at DESC), '[]'::json)
+        INTO deals_now_pick
+        FROM updated u;
+
+        RETURN NEXT;
+    END
+    $fn$
+"""
+
+def get_db_credentials(secret_name):
+    """Fetch and cache the database secret for the lifetime of the container."""
+    global _secrets_client, _db_credentials_cache
+    if _db_credentials_cache is None:
+        if _secrets_client is None:
+            _secrets_client = boto3.client('secretsmanager')
+        r = _secrets_client.get_secret_value(SecretId=secret_name)
+        _db_credentials_cache = json.loads(r['SecretString'])
+    return _db_credentials_cache
+
+def open_db_connection():
     """Connect via AWS Secrets Manager (Aurora PostgreSQL) or DB_* env. Port 5432 for Aurora."""
+    secret_name = os.environ.get('DB_SECRET_NAME') or os.environ.get('DB_SECRET_ARN')
+    if secret_name:
+        cred = get_db_credentials(secret_name)
+        return pg8000.connect(
+            host=cred.get('host') or cred.get('endpoint'),
+            port=int(cred.get('port', 5432)),
+            database=cred.get('dbname') or cred.get('database') or 'postgres',
+            user=cred.get('username') or cred.get('user'),
+            password=cred.get('password')
+        )
+    if DB_HOST and DB_USER and DB_PASSWORD:
+        return pg8000.connect(
+            host=DB_HOST,
+            database=DB_NAME or 'postgres',
+            user=DB_USER,
+            password=DB_PASSWORD,
+            port=int(os.environ.get('DB_PORT', 5432))
+        )
+    return None
+
+def reset_db_connection():
+    """Close and forget the cached connection so the next call reconnects."""
+    global _db_connection
+    if _db_connection is not None:
+        try:
+            _db_connection.close()
+        except Exception:
+            pass
+    _db_connection = None
+
+def get_db_connection():
+    """Return the container's cached connection, reconnecting if it no longer answers."""
+    global _db_connection, _db_credentials_cache
+    if _db_connection is not None:
+        try:
+            cur = _db_connection.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            if not _db_connection.autocommit:
+                _db_connection.rollback()
+            return _db_connection
+        except Exception as e:
+            logger.warning("Cached database connection is no longer usable, reconnecting: %s", e)
+            reset_db_connection()
     try:
-        secret_name = os.environ.get('DB_SECRET_NAME') or os.environ.get('DB_SECRET_ARN')
-        if secret_name:
-            client = boto3.client('secretsmanager')
-            r = client.get_secret_value(SecretId=secret_name)
-            cred = json.loads(r['SecretString'])
-            return pg8000.connect(
-                host=cred.get('host') or cred.get('endpoint'),
-                port=int(cred.get('port', 5432)),
-                database=cred.get('dbname') or cred.get('database') or 'postgres',
-                user=cred.get('username') or cred.get('user'),
-                password=cred.get('password')
-            )
-        if DB_HOST and DB_USER and DB_PASSWORD:
-            return pg8000.connect(
-                host=DB_HOST,
-                database=DB_NAME or 'postgres',
-                user=DB_USER,
-                password=DB_PASSWORD,
-                port=int(os.environ.get('DB_PORT', 5432))
-            )
-        return None
+        _db_connection = open_db_connection()
+        return _db_connection
     except pg8000.Error as e:
-        print(f"Database connection error: {e}")
+        logger.error("Database connection error: %s", e)
+        # Credentials may have been rotated; fetch them again next time
+        _db_credentials_cache = None
         return None
     except Exception as e:
-        print(f"Unexpected error during database connection: {e}")
+        logger.error("Unexpected error during database connection: %s", e)
         return None
 
 def get_schema_name(country):
     """Get the appropriate schema name for the given country."""
-    if not country:
-        return 'deals_master'
-    
-    # Try exact match first
-    if country in SCHEMA_MAPPING:
-        return SCHEMA_MAPPING[country]
-    
-    # Try lowercase match
-    country_lower = country.lower()
-    if country_lower in SCHEMA_MAPPING:
-        return SCHEMA_MAPPING[country_lower]
+    schema_name = _NORMALIZED_SCHEMA_MAPPING.get((country or '').lower())
+    if schema_name:
+        return schema_name
     
-    # Try uppercase match
-    country_upper = country.upper()
-    if country_upper in SCHEMA_MAPPING:
-        return SCHEMA_MAPPING[country_upper]
-    
-    print(f"Warning: Country '{country}' not found in schema mapping, using default 'deals_master'")
+    if country:
+        logger.warning("Country '%s' not found in schema mapping, using default 'deals_master'", country)
     return 'deals_master'
 
+def set_schema_search_path(cur, schema_name):
+    """Resolve unqualified table names against schema_name for the current transaction."""
+    # SET cannot take bind parameters; set_config(..., true) is the SET LOCAL equivalent
+    cur.execute("SELECT set_config('search_path', %s, true)", (f"{identifier(schema_name)}, public",))
+
+def apply_promo_migrations(conn, schema_name):
+    """Create the promo history table, its indexes and run_daily_promo_update in schema_name.
+
+    Runs in autocommit mode because CREATE INDEX CONCURRENTLY cannot run inside
+    a transaction block. Every statement is idempotent. The connection's
+    autocommit mode and search_path are restored afterwards, since it is cached.
+    """
+    quoted_schema = identifier(schema_name)
+    previous_autocommit = conn.autocommit
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute(PROMO_HISTORY_TABLE_SQL.format(schema=quoted_schema))
+        # The function is created in, and resolves its tables against, the first search_path schema
+        cur.execute("SELECT set_config('search_path', %s, false)", (f"{quoted_schema}, public",))
+        cur.execute(PROMO_UPDATE_FUNCTION_SQL)
+        index_sql_by_name = dict(PROMO_INDEX_SQL)
+        cur.execute("SELECT to_regclass(%s::text) IS NOT NULL", (f"{quoted_schema}.promo_master",))
+        if cur.fetchone()[0]:
+            index_sql_by_name.update(PROMO_MASTER_INDEX_SQL)
+        for index_sql in index_sql_by_name.values():
+            cur.execute(index_sql.format(schema=quoted_schema))
+        rebuild_invalid_promo_indexes(cur, schema_name, index_sql_by_name)
+        logger.info("Applied promo migrations to %s", schema_name)
+    finally:
+        try:
+            cur.execute("RESET search_path")
+        except pg8000.Error as e:
+            logger.warning("Could not reset search_path after promo migrations: %s", e)
+        finally:
+            cur.close()
+            conn.autocommit = previous_autocommit
+
+def rebuild_invalid_promo_indexes(cur, schema_name, index_sql_by_name):
+    """Drop and recreate promo indexes left INVALID by an interrupted CREATE INDEX CONCURRENTLY.
+
+    IF NOT EXISTS skips an invalid index, so without this it would never be rebuilt.
+    """
+    quoted_schema = identifier(schema_name)
+    cur.execute(INVALID_PROMO_INDEXES_SQL, (quoted_schema, list(index_sql_by_name)))
+    for (index_name,) in cur.fetchall():
+        logger.warning("Rebuilding invalid index %s.%s", schema_name, index_name)
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {quoted_schema}.{identifier(index_name)}")
+        cur.execute(index_sql_by_name[index_name].format(schema=quoted_schema))
+
 def verify_schema_and_tables(cur, schema_name):
     """Verify schema exists and create necessary tables if missing."""
+    if schema_name in _schema_verified_cache:
+        logger.debug("Schema %s already verified in this container, skipping checks", schema_name)
+        return True
     try:
-        print(f"Checking if schema {schema_name} exists...")
-        # Check if schema exists
-        schema_check_query = """
-            SELECT EXISTS (
-                SELECT FROM information_schema.schemata 
-                WHERE schema_name = %s
-            )
+        logger.debug("Checking schema %s and its product table...", schema_name)
+        # Resolve the schema, the promo tables, the update function and product's
+        # columns straight from pg_catalog in one round-trip
+        catalog_query = """
+            SELECT
+                to_regnamespace(%s::text) IS NOT NULL,
+                to_regclass(%s::text) IS NOT NULL,
+                to_regclass(%s::text) IS NOT NULL,
+                to_regprocedure(%s::text) IS NOT NULL,
+                ARRAY(
+                    SELECT attname::text
+                    FROM pg_attribute
+                    WHERE attrelid = to_regclass(%s::text)
+                    AND attnum > 0
+                    AND NOT attisdropped
+                )
         """
-        cur.execute(schema_check_query, (schema_name,))
-        schema_exists = cur.fetchone()[0]
-        print(f"Schema {schema_name} exists: {schema_exists}")
+        quoted_schema = identifier(schema_name)
+        product_table = f"{quoted_schema}.product"
+        history_table = f"{quoted_schema}.product_promo_history"
+        update_function = f"{quoted_schema}.run_daily_promo_update(boolean)"
+        cur.execute(catalog_query, (quoted_schema, product_table, history_table, update_function, product_table))
+        schema_exists, product_table_exists, history_table_exists, update_function_exists, columns = cur.fetchone()
+        logger.debug("Schema %s exists: %s, product table exists: %s", schema_name, schema_exists, product_table_exists)
         
         if not schema_exists:
             raise Exception(f"Schema {schema_name} does not exist")
         
-        print(f"Checking if product table exists in {schema_name}...")
-        # Check if product table exists
-        product_table_check = """
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = %s 
-                AND table_name = 'product'
-            )
-        """
-        cur.execute(product_table_check, (schema_name,))
-        product_table_exists = cur.fetchone()[0]
-        print(f"Product table exists in {schema_name}: {product_table_exists}")
-        
         if not product_table_exists:
             raise Exception(f"Product table does not exist in schema {schema_name}")
         
-        # Test a simple query on the product table to ensure we can access it
-        print(f"Testing access to {schema_name}.product table...")
-        test_query = f"SELECT COUNT(*) FROM {schema_name}.product LIMIT 1"
-        cur.execute(test_query)
-        count_result = cur.fetchone()[0]
-        print(f"Product table access test successful. Total products: {count_result}")
+        if not history_table_exists or not update_function_exists:
+            raise Exception(f"Promo migrations have not been applied to schema {schema_name}; "
+                            f"run the update_promo_products_daily.migrate_handler Lambda")
         
-        # Check the columns in the product table
-        print(f"Checking columns in {schema_name}.product table...")
-        columns_query = """
-            SELECT column_name, data_type 
-            FROM information_schema.columns 
-            WHERE table_schema = %s AND table_name = 'product'
-            ORDER BY ordinal_position
-        """
-        cur.execute(columns_query, (schema_name,))
-        columns = cur.fetchall()
-        print(f"Product table columns: {[col[0] for col in columns]}")
+        # Confirm we can read the product table; LIMIT 1 stops after one row instead of counting them all
+        logger.debug("Testing access to %s.product table...", schema_name)
+        cur.execute("SELECT 1 FROM product LIMIT 1")
+        cur.fetchone()
+        logger.debug("Product table access test successful")
+        
+        column_names = frozenset(columns)
+        if PROMO_DEBUG:
+            logger.debug("Product table columns: %s", sorted(column_names))
         
         # Check for required columns
-        column_names = [col[0] for col in columns]
-        required_columns = ['product_id', 'product_name', 'deal_price', 'original_price', 'discount_percent', 'is_active', 'promo_label', 'updated_at']
-        missing_columns = [col for col in required_columns if col not in column_names]
+        missing_columns = sorted(REQUIRED_PRODUCT_COLUMNS - column_names)
         
         if missing_columns:
-            print(f"Warning: Missing columns in {schema_name}.product: {missing_columns}")
+            logger.warning("Missing columns in %s.product: %s", schema_name, missing_columns)
         else:
-            print("All required columns found in product table")
+            logger.debug("All required columns found in product table")
         
-        print(f"Schema {schema_name} and required tables verified successfully")
+        _schema_verified_cache.add(schema_name)
+        logger.info("Schema %s and required tables verified successfully", schema_name)
         return True
         
     except pg8000.Error as e:
         error_msg = f"Database error during schema verification: {e}"
-        print(error_msg)
+        logger.error(error_msg)
         raise Exception(error_msg)
     except Exception as e:
         error_msg = f"Schema verification failed: {e}"
-        print(error_msg)
+        logger.error(error_msg)
         raise e
 
-def clear_previous_deal_of_the_day(cur, schema_name):
-    """Clear previous deal of the day records by setting promo_label to empty string."""
-    try:
-        print(f"Executing clear previous deal of the day query on {schema_name}...")
-        update_query = f"""
-            UPDATE {schema_name}.product 
-            SET promo_label = '',
-                deal_type_id = 1,  
-                updated_at = %s
-            WHERE promo_label = 'deal_of_the_day'
-        """
-        now = datetime.datetime.now(datetime.timezone.utc)
-        print(f"Query: {update_query}")
-        cur.execute(update_query, (now,))
-        updated_count = cur.rowcount
-        print(f"Clear deal of the day query executed successfully. Updated {updated_count} rows")
-        if updated_count > 0:
-            print(f"Cleared {updated_count} previous deal of the day from {schema_name}")
-        return updated_count
-    except pg8000.Error as e:
-        error_msg = f"Database error clearing previous deal of the day: {e}"
-        print(error_msg)
-        raise Exception(error_msg)
-    except Exception as e:
-        error_msg = f"Unexpected error clearing previous deal of the day: {e}"
-        print(error_msg)
-        raise
-
-def get_previously_picked_products(cur, schema_name):
-    """Get list of product IDs that were previously picked for any promo label."""
-    try:
-        # First check if the table exists
-        check_table_query = """
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = %s 
-                AND table_name = 'product_promo_history'
-            )
-        """
-        cur.execute(check_table_query, (schema_name,))
-        table_exists = cur.fetchone()[0]
-        
-        if not table_exists:
-            print(f"Table {schema_name}.product_promo_history does not exist, returning empty list")
-            return []
-        
-        # Get products that were picked in the last 7 days to avoid re-picking recent selections
-        select_query = f"""
-            SELECT DISTINCT product_id
-            FROM {schema_name}.product_promo_history
-            WHERE created_at >= NOW() - INTERVAL '7 days'
-            ORDER BY product_id
-        """
-        cur.execute(select_query)
-        results = cur.fetchall()
-        previously_picked = [row[0] for row in results]
-        print(f"Found {len(previously_picked)} previously picked products in last 7 days from {schema_name}")
-        return previously_picked
-    except pg8000.Error as e:
-        print(f"Database error getting previously picked products: {e}")
-        # If table doesn't exist or error, return empty list
-        return []
-    except Exception as e:
-        print(f"Unexpected error getting previously picked products: {e}")
-        return []
-
-def record_promo_selection(cur, product_id, promo_label, schema_name):
-    """Record that a product was selected for a promo label."""
-    try:
-        # First check if the table exists, if not create it
-        check_table_query = """
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = %s 
-                AND table_name = 'product_promo_history'
-            )
-        """
-        cur.execute(check_table_query, (schema_name,))
-        table_exists = cur.fetchone()[0]
-        
-        if not table_exists:
-            # Create the table if it doesn't exist
-            create_table_query = f"""
-                CREATE TABLE IF NOT EXISTS {schema_name}.product_promo_history (
-                    id SERIAL PRIMARY KEY,
-                    product_id VARCHAR(255) NOT NULL,
-                    promo_label VARCHAR(100) NOT NULL,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-                )
-            """
-            cur.execute(create_table_query)
-            print(f"Created table {schema_name}.product_promo_history")
-        
-        insert_query = f"""
-            INSERT INTO {schema_name}.product_promo_history 
-            (product_id, promo_label, created_at) 
-            VALUES (%s, %s, %s)
-        """
-        now = datetime.datetime.now(datetime.timezone.utc)
-        cur.execute(insert_query, (product_id, promo_label, now))
-        print(f"Recorded {promo_label} selection for product {product_id} in {schema_name}")
-    except pg8000.Error as e:
-        print(f"Database error recording promo selection: {e}")
-        # Continue execution even if recording fails
-    except Exception as e:
-        print(f"Unexpected error recording promo selection: {e}")
-        # Continue execution even if recording fails
+def format_promo_pick(pick):
+    """Convert a pick returned by run_daily_promo_update into the response shape."""
+    return {
+        'product_id': pick['product_id'],
+        'product_name': pick['product_name'],
+        'deal_price': float(pick['deal_price']),
+        'original_price': float(pick['original_price']),
+        'discount_percent': float(pick['discount_percent'])
+    }
 
-def find_and_update_deal_of_the_day(cur, previously_picked_products, schema_name):
-    """Find the most recent product meeting criteria and set as deal of the day."""
+def run_daily_promo_update(cur, schema_name):
+    """Run the server-side promo update for the schema and return its results."""
     try:
-        # Find the most recent product that meets criteria
-        # Requirements: discount_percent > 30% and deal_price > $36
-        select_query = f"""
-            SELECT product_id, product_name, deal_price, original_price, discount_percent
-            FROM {schema_name}.product
-            WHERE is_active = true
-            AND deal_price > 36
-            AND discount_percent > 27
-            AND promo_label != 'deal_of_the_day' and promo_label != 'deals_now_pick'
-        """
-        
-        # Add exclusion for previously picked products
-        if previously_picked_products:
-            placeholders = ','.join(['%s'] * len(previously_picked_products))
-            select_query += f" AND product_id NOT IN ({placeholders})"
-        
-        select_query += """
-            ORDER BY updated_at DESC
-            LIMIT 1
-        """
-        
-        # Execute with parameters if we have previously picked products
-        if previously_picked_products:
-            cur.execute(select_query, previously_picked_products)
-        else:
-            cur.execute(select_query)
-        
-        result = cur.fetchone()
-        
-        if not result:
-            print("No products found for deal of the day")
-            return None
-        
-        product_id = result[0]
-        product_name = result[1]
-        deal_price = result[2]
-        original_price = result[3]
-        discount_percent = result[4]
-        
-        # Update the selected product
-        update_query = f"""
-            UPDATE {schema_name}.product 
-            SET promo_label = 'deal_of_the_day',
-                deal_type_id=1,
-                updated_at = %s
-            WHERE product_id = %s
-        """
-        now = datetime.datetime.now(datetime.timezone.utc)
-        cur.execute(update_query, (now, product_id))
-        
-        if cur.rowcount > 0:
-            # Record this selection in history
-            record_promo_selection(cur, product_id, 'deal_of_the_day', schema_name)
-            
-            print(f"Deal of the day: {product_name} (${deal_price}, {discount_percent}% off)")
-            return {
-                'product_id': product_id,
-                'product_name': product_name,
-                'deal_price': float(deal_price),
-                'original_price': float(original_price),
-                'discount_percent': float(discount_percent)
+        cur.execute("SELECT * FROM run_daily_promo_update(%s::boolean)", (PROMO_DEBUG,))
+        (cleared_count, cleared_deals_now_pick, previously_picked_count,
+         deal_of_day_count, deals_now_pick_count, deal_of_the_day, deals_now_pick) = cur.fetchone()
+        
+        new_deal = format_promo_pick(deal_of_the_day) if deal_of_the_day else None
+        new_deals_now_pick = [format_promo_pick(pick) for pick in deals_now_pick or []]
+        
+        available_products = None
+        if PROMO_DEBUG:
+            available_products = {
+                'deal_of_day_candidates': deal_of_day_count,
+                'deals_now_pick_candidates': deals_now_pick_count
             }
+            logger.info("Available candidates in %s: %s for deal of the day, %s for deals now pick",
+                        schema_name, deal_of_day_count, deals_now_pick_count)
+        logger.info("Found %d previously picked products in last 7 days from %s", previously_picked_count, schema_name)
+        logger.info("Cleared %d previous deal of the day and %d previous deals now pick from %s",
+                    cleared_count, cleared_deals_now_pick, schema_name)
+        if new_deal:
+            logger.info("Deal of the day: %s ($%s, %s%% off)", new_deal['product_name'], new_deal['deal_price'], new_deal['discount_percent'])
         else:
-            print(f"Failed to update product {product_id}")
-            return None
-            
-    except pg8000.Error as e:
-        print(f"Database error finding/updating deal of the day: {e}")
-        raise
-    except Exception as e:
-        print(f"Unexpected error finding/updating deal of the day: {e}")
-        raise
-
-def clear_previous_deals_now_pick(cur, schema_name):
-    """Clear previous deals_now_pick records by setting promo_label to empty string."""
-    try:
-        update_query = f"""
-            UPDATE {schema_name}.product 
-            SET promo_label = '', 
-                deal_type_id=1,
-                updated_at = %s
-            WHERE promo_label = 'deals_now_pick'
-        """
-        now = datetime.datetime.now(datetime.timezone.utc)
-        cur.execute(update_query, (now,))
-        updated_count = cur.rowcount
-        if updated_count > 0:
-            print(f"Cleared {updated_count} previous deals now pick from {schema_name}")
-        return updated_count
-    except pg8000.Error as e:
-        print(f"Database error clearing previous deals_now_pick: {e}")
-        raise
-    except Exception as e:
-        print(f"Unexpected error clearing previous deals_now_pick: {e}")
-        raise
-
-def find_and_update_deals_now_pick(cur, previously_picked_products, schema_name, exclude_product_id=None):
-    """Find and update three most recent products as deals_now_pick based on discount and price criteria."""
-    try:
-        # Requirements: discount_percent > 27% and deal_price > $27
-        # Get 3 most recent products meeting criteria, excluding deal of the day if provided
-        select_query = f"""
-            SELECT product_id, product_name, deal_price, original_price, discount_percent
-            FROM {schema_name}.product
-            WHERE is_active = true
-            AND deal_price > 25
-            AND discount_percent > 25
-            AND promo_label != 'deal_of_the_day' and promo_label != 'deals_now_pick' 
-        """
-        
-        # Build exclusion list
-        excluded_ids = []
-        if exclude_product_id:
-            excluded_ids.append(exclude_product_id)
-        if previously_picked_products:
-            excluded_ids.extend(previously_picked_products)
-        
-        # Add exclusions to query
-        if excluded_ids:
-            placeholders = ','.join(['%s'] * len(excluded_ids))
-            select_query += f" AND product_id NOT IN ({placeholders})"
-        
-        select_query += """
-            ORDER BY updated_at DESC
-            LIMIT 3
-        """
-        
-        # Execute with parameters if we have exclusions
-        if excluded_ids:
-            cur.execute(select_query, excluded_ids)
+            logger.warning("No products found for deal of the day")
+        if new_deals_now_pick:
+            logger.info("Deals now pick: %d products selected", len(new_deals_now_pick))
+            for pick in new_deals_now_pick:
+                logger.info("  - %s ($%s, %s%% off)", pick['product_name'], pick['deal_price'], pick['discount_percent'])
         else:
-            cur.execute(select_query)
-        
-        results = cur.fetchall()
-        
-        if not results:
-            print("No products found for deals now pick")
-            return []
-        
-        picks = []
-        now = datetime.datetime.now(datetime.timezone.utc)
-        
-        for result in results:
-            product_id = result[0]
-            product_name = result[1]
-            deal_price = result[2]
-            original_price = result[3]
-            discount_percent = result[4]
-            
-            # Update the selected product
-            update_query = f"""
-                UPDATE {schema_name}.product 
-                SET promo_label = 'deals_now_pick',
-                    updated_at = %s
-                WHERE product_id = %s
-            """
-            cur.execute(update_query, (now, product_id))
-            
-            if cur.rowcount > 0:
-                # Record this selection in history
-                record_promo_selection(cur, product_id, 'deals_now_pick', schema_name)
-                
-                picks.append({
-                    'product_id': product_id,
-                    'product_name': product_name,
-                    'deal_price': float(deal_price),
-                    'original_price': float(original_price),
-                    'discount_percent': float(discount_percent)
-                })
-        
-        if picks:
-            print(f"Deals now pick: {len(picks)} products selected")
-            for pick in picks:
-                print(f"  - {pick['product_name']} (${pick['deal_price']}, {pick['discount_percent']}% off)")
-        
-        return picks
-        
-    except pg8000.Error as e:
-        print(f"Database error finding/updating deals_now_pick: {e}")
-        raise
-    except Exception as e:
-        print(f"Unexpected error finding/updating deals_now_pick: {e}")
-        raise
-
-def check_available_products(cur, schema_name):
-    """Check how many products are available that meet our criteria."""
-    try:
-        # Check for deal of the day candidates
-        deal_of_day_query = f"""
-            SELECT COUNT(*) as count
-            FROM {schema_name}.product
-            WHERE is_active = true
-            AND deal_price > 36
-            AND discount_percent > 30
-            AND promo_label != 'deal_of_the_day'
-        """
-        cur.execute(deal_of_day_query)
-        deal_of_day_count = cur.fetchone()[0]
-        
-        # Check for deals now pick candidates
-        deals_now_pick_query = f"""
-            SELECT COUNT(*) as count
-            FROM {schema_name}.product
-            WHERE is_active = true
-            AND deal_price > 27
-            AND discount_percent > 27
-            AND promo_label != 'deals_now_pick'
-        """
-        cur.execute(deals_now_pick_query)
-        deals_now_pick_count = cur.fetchone()[0]
-        
-        print(f"Available candidates in {schema_name}: {deal_of_day_count} for deal of the day, {deals_now_pick_count} for deals now pick")
+            logger.warning("No products found for deals now pick")
         
         return {
-            'deal_of_day_candidates': deal_of_day_count,
-            'deals_now_pick_candidates': deals_now_pick_count
+            'available_products': available_products,
+            'previously_picked_count': previously_picked_count,
+            'cleared_previous_deals': cleared_count,
+            'cleared_previous_deals_now_pick': cleared_deals_now_pick,
+            'deal_of_the_day': new_deal,
+            'deals_now_pick': new_deals_now_pick
         }
-        
+    except pg8000.Error as e:
+        error_msg = f"Database error running daily promo update: {e}"
+        logger.error(error_msg)
+        raise Exception(error_msg)
     except Exception as e:
-        print(f"Error checking available products: {e}")
-        return None
+        error_msg = f"Unexpected error running daily promo update: {e}"
+        logger.error(error_msg)
+        raise
 
 def run_update(country='us', schema_name=None):
     conn = None
@@ -490,7 +506,7 @@ def run_update(country='us', schema_name=None):
         if schema_name is None:
             schema_name = get_schema_name(country)
         
-        print(f"Starting promo products update for {country.upper()} using schema: {schema_name}")
+        logger.info("Starting promo products update for %s using schema: %s", country.upper(), schema_name)
         
         conn = get_db_connection()
         if not conn:
@@ -506,75 +522,49 @@ def run_update(country='us', schema_name=None):
         cur = conn.cursor()
         
         try:
+            # Every query below uses unqualified names resolved through search_path
+            set_schema_search_path(cur, schema_name)
+            
             # Step 1: Verify schema and tables exist
-            print("Step 1: Verifying schema and tables...")
+            logger.debug("Step 1: Verifying schema and tables...")
             verify_schema_and_tables(cur, schema_name)
-            print("Step 1: Schema verification completed")
-            
-            # Step 2: Get previously picked products to avoid re-selection
-            print("Step 2: Getting previously picked products...")
-            previously_picked_products = get_previously_picked_products(cur, schema_name)
-            print(f"Step 2: Found {len(previously_picked_products)} previously picked products")
+            logger.debug("Step 1: Schema verification completed")
             
-            # Step 3: Check available products first
-            print("Step 3: Checking available products...")
-            available_products = check_available_products(cur, schema_name)
-            print("Step 3: Available products check completed")
+            # Step 2: Clear previous picks, pick new ones and record history server-side
+            logger.debug("Step 2: Running daily promo update...")
+            promo_result = run_daily_promo_update(cur, schema_name)
+            logger.debug("Step 2: Daily promo update completed")
             
-            # Step 4: Clear previous selections
-            print("Step 4: Clearing previous deal of the day...")
-            cleared_count = clear_previous_deal_of_the_day(cur, schema_name)
-            print(f"Step 4: Cleared {cleared_count} previous deal of the day")
-            
-            print("Step 5: Clearing previous deals now pick...")
-            cleared_deals_now_pick = clear_previous_deals_now_pick(cur, schema_name)
-            print(f"Step 5: Cleared {cleared_deals_now_pick} previous deals now pick")
-            
-            # Step 6: Find and update deal of the day (excluding previously picked products)
-            print("Step 6: Finding and updating deal of the day...")
-            new_deal = find_and_update_deal_of_the_day(cur, previously_picked_products, schema_name)
-            print(f"Step 6: Deal of the day update completed: {new_deal is not None}")
-            
-            # Step 7: Find and update deals now pick (excluding previously picked products and deal of the day)
-            print("Step 7: Finding and updating deals now pick...")
-            deal_of_day_id = new_deal['product_id'] if new_deal else None
-            new_deals_now_pick = find_and_update_deals_now_pick(cur, previously_picked_products, schema_name, exclude_product_id=deal_of_day_id)
-            print(f"Step 7: Deals now pick update completed: {len(new_deals_now_pick)} products")
-            
-            # Step 8: Commit all changes
-            print("Step 8: Committing transaction...")
+            # Step 3: Commit all changes
+            logger.debug("Step 3: Committing transaction...")
             conn.commit()
-            print("Step 8: Transaction committed successfully")
+            logger.debug("Step 3: Transaction committed successfully")
             
             response_data = {
                 'success': True,
                 'country': country,
                 'schema': schema_name,
-                'available_products': available_products,
-                'previously_picked_count': len(previously_picked_products),
-                'cleared_previous_deals': cleared_count,
-                'cleared_previous_deals_now_pick': cleared_deals_now_pick,
-                'deal_of_the_day': new_deal,
-                'deals_now_pick': new_deals_now_pick,
+                **promo_result,
                 'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat()
             }
             
-            print(f"Promo products update completed for {country.upper()} using schema {schema_name}")
+            logger.info("Promo products update completed for %s using schema %s", country.upper(), schema_name)
             return response_data
             
         except Exception as e:
             # Rollback the transaction on any error
-            print(f"Error during transaction at step, rolling back: {str(e)}")
+            logger.error("Error during transaction at step, rolling back: %s", e)
             try:
                 conn.rollback()
-                print("Transaction rolled back successfully")
+                logger.info("Transaction rolled back successfully")
             except Exception as rollback_error:
-                print(f"Error during rollback: {rollback_error}")
+                logger.error("Error during rollback: %s", rollback_error)
+                reset_db_connection()
             raise e
         
     except Exception as e:
         error_msg = f"Error updating promo products for {country}: {str(e)}"
-        print(f"Error: {error_msg}")
+        logger.error("Error: %s", error_msg)
         return {
             'success': False, 
             'error': error_msg,
@@ -582,23 +572,20 @@ def run_update(country='us', schema_name=None):
             'schema': schema_name or get_schema_name(country)
         }
     finally:
+        # The connection stays open for the next warm invocation
         if cur:
             try:
                 cur.close()
             except:
                 pass
-        if conn:
-            try:
-                conn.close()
-            except:
-                pass
 
 def lambda_handler(event, context):
     # Extract parameters from event payload
     country = 'us'  # default
     schema_name = None  # default (will be derived from country)
     
-    print(f"Raw event received: {json.dumps(event) if event else 'None'}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw event received: %s", json.dumps(event) if event else 'None')
     
     if event:
         # Support direct parameters
@@ -614,12 +601,8 @@ def lambda_handler(event, context):
     country_normalized = country.lower() if country else 'us'
     derived_schema = get_schema_name(country)
     
-    print(f"Lambda handler called:")
-    print(f"  - Original country: {country}")
-    print(f"  - Normalized country: {country_normalized}")
-    print(f"  - Provided schema: {schema_name}")
-    print(f"  - Derived schema: {derived_schema}")
-    print(f"  - Final schema to use: {schema_name or derived_schema}")
+    logger.debug("Lambda handler called: country=%s, normalized=%s, provided schema=%s, derived schema=%s, final schema=%s",
+                 country, country_normalized, schema_name, derived_schema, schema_name or derived_schema)
     
     result = run_update(country, schema_name)
     status_code = 200 if result.get('success') else 500
@@ -632,6 +615,51 @@ def lambda_handler(event, context):
         }
     }
 
+def find_existing_schemas(conn, schema_names):
+    """Return the schemas in schema_names that exist in the database."""
+    cur = conn.cursor()
+    try:
+        existing = []
+        for schema_name in schema_names:
+            cur.execute("SELECT to_regnamespace(%s::text) IS NOT NULL", (identifier(schema_name),))
+            if cur.fetchone()[0]:
+                existing.append(schema_name)
+        return existing
+    finally:
+        cur.close()
+        # CREATE INDEX CONCURRENTLY must not find this read's transaction still open
+        if not conn.autocommit:
+            conn.rollback()
+
+def migrate_handler(event, context):
+    """Deploy-time migration entry point, invoked by the CDK trigger after each deployment.
+
+    Migrates this stack's schema (DB_SCHEMA) and every other schema lambda_handler
+    can derive from a country, skipping those absent from this database. An event
+    with 'schemas' (or 'schema') migrates exactly those instead.
+    """
+    event = event or {}
+    requested_schemas = event.get('schemas') or ([event['schema']] if event.get('schema') else None)
+    conn = get_db_connection()
+    if not conn:
+        raise Exception('Failed to establish database connection')
+    
+    if requested_schemas:
+        schema_names = list(dict.fromkeys(requested_schemas))
+        skipped_schemas = []
+    else:
+        own_schema = os.environ.get('DB_SCHEMA') or get_schema_name(os.environ.get('COUNTRY'))
+        mapped_schemas = sorted(set(SCHEMA_MAPPING.values()) - {own_schema})
+        existing_schemas = find_existing_schemas(conn, mapped_schemas)
+        skipped_schemas = [name for name in mapped_schemas if name not in existing_schemas]
+        schema_names = [own_schema] + existing_schemas
+        if skipped_schemas:
+            logger.warning("Skipping promo migrations for schemas absent from this database: %s", skipped_schemas)
+    
+    for schema_name in schema_names:
+        apply_promo_migrations(conn, schema_name)
+    return {'success': True, 'schemas': schema_names, 'skipped': skipped_schemas}
+
 def main():
     # For local testing, you can specify country and schema as environment variables
     country = os.environ.get('COUNTRY', 'us')
@@ -1,73 +1,64 @@
 #!/usr/bin/env python3
 """
 Helper script to add Secrets Manager database credential retrieval to Lambda functions.
-This script prepends the necessary code to each Lambda function.
+This script adds an import of the shared lambda-functions/db_helpers.py module to each Lambda function.
 """
 
 import os
 import re
+from datetime import datetime
 
-# Standard Secrets Manager helper code to add to each Lambda function
-SECRETS_MANAGER_CODE = '''import os
-import json
-import boto3
-from botocore.exceptions import ClientError
+# Lambda functions import the shared helpers from lambda-functions/db_helpers.py
+SECRETS_MANAGER_CODE = 'from db_helpers import get_db_connection, get_db_credentials\n'
 
-# Cache credentials to avoid repeated Secrets Manager calls
-_db_credentials_cache = None
+# A copy of the helpers inlined by earlier versions of this script
+INLINED_HELPERS_RE = re.compile(
+    r'^# Cache credentials[^\n]*\n_db_credentials_cache = None\n'
+    r'.*?^def get_db_connection\(\):.*?'
+    r'print\(f"Database connection error: \{e\}"\)\n\s+raise\n\n?',
+    re.MULTILINE | re.DOTALL
+)
 
-def get_db_credentials():
-    """Get database credentials from Secrets Manager with caching"""
-    global _db_credentials_cache
-    
-    if _db_credentials_cache is not None:
-        return _db_credentials_cache
-    
-    secret_name = os.environ.get('DB_SECRET_NAME')
-    region = os.environ.get('AWS_REGION', 'us-east-2')
-    
-    if not secret_name:
-        raise ValueError("DB_SECRET_NAME environment variable not set")
+# Top-level import statements, including parenthesized multi-line "from x import (...)"
+IMPORT_LINE_RE = re.compile(
+    r'^(?:import[ \t]+[^\n]+|from[ \t]+\S+[ \t]+import[ \t]+(?:\([^)]*\)|[^\n]+))$',
+    re.MULTILINE
+)
+
+def write_with_backup(filepath, content, new_content, backup_dir):
+    """Save the original content under backup_dir, then atomically replace the file"""
+    os.makedirs(backup_dir, exist_ok=True)
+    backup_path = os.path.join(backup_dir, os.path.basename(filepath))
+    with open(backup_path, 'w', newline='') as f:
+        f.write(content)
     
-    client = boto3.client('secretsmanager', region_name=region)
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        f.write(new_content)
+    os.replace(tmp_path, filepath)
     
-    try:
-        response = client.get_secret_value(SecretId=secret_name)
-        _db_credentials_cache = json.loads(response['SecretString'])
-        return _db_credentials_cache
-    except ClientError as e:
-        print(f"Error retrieving secret {secret_name}: {e}")
-        raise
-
-def get_db_connection():
-    """Create database connection using Secrets Manager credentials"""
-    import pg8000
-    
-    creds = get_db_credentials()
-    
-    try:
-        conn = pg8000.connect(
-            host=creds['host'],
-            database=creds['dbname'],
-            user=creds['username'],
-            password=creds['password'],
-            port=creds.get('port', 5432)
-        )
-        return conn
-    except Exception as e:
-        print(f"Database connection error: {e}")
-        raise
-
-'''
+    print(f"  ✓ Backup saved to {backup_path}")
 
-def process_lambda_file(filepath):
+def process_lambda_file(filepath, backup_dir):
     """Process a single Lambda function file"""
     print(f"\nProcessing: {filepath}")
     
-    with open(filepath, 'r') as f:
+    with open(filepath, 'r', newline='') as f:
         content = f.read()
     
-    # Check if already has Secrets Manager code
+    # Check if already imports the shared helpers
+    if SECRETS_MANAGER_CODE.strip() in content:
+        print(f"  ✓ Already imports db_helpers")
+        return False
+    
+    # Replace a previously inlined copy of the helpers with the import
+    if INLINED_HELPERS_RE.search(content):
+        new_content = INLINED_HELPERS_RE.sub(lambda _: SECRETS_MANAGER_CODE, content, count=1)
+        write_with_backup(filepath, content, new_content, backup_dir)
+        print(f"  ✓ Replaced inlined Secrets Manager code with db_helpers import")
+        return True
+    
+    # Check if already has its own Secrets Manager code
     if 'get_db_credentials' in content:
         print(f"  ✓ Already has Secrets Manager code")
         return False
@@ -77,31 +68,19 @@ def process_lambda_file(filepath):
         print(f"  → Skipping (no database connection)")
         return False
     
-    # Find where to insert the code (after imports)
-    lines = content.split('\n')
-    insert_index = 0
-    
-    # Find the last import statement
-    for i, line in enumerate(lines):
-        if line.strip().startswith('import ') or line.strip().startswith('from '):
-            insert_index = i + 1
-    
-    # Insert the Secrets Manager code
-    lines.insert(insert_index, SECRETS_MANAGER_CODE)
-    
-    # Write back
-    new_content = '\n'.join(lines)
+    # Insert the import right after the last top-level import statement
+    last_import = None
+    for last_import in IMPORT_LINE_RE.finditer(content):
+        pass
+    if last_import:
+        insert_at = last_import.end()
+        new_content = content[:insert_at] + '\n' + SECRETS_MANAGER_CODE.rstrip('\n') + content[insert_at:]
+    else:
+        new_content = SECRETS_MANAGER_CODE + content
     
-    # Create backup
-    backup_path = filepath + '.backup'
-    with open(backup_path, 'w') as f:
-        f.write(content)
-    
-    with open(filepath, 'w') as f:
-        f.write(new_content)
+    write_with_backup(filepath, content, new_content, backup_dir)
     
-    print(f"  ✓ Added Secrets Manager code")
-    print(f"  ✓ Backup saved to {backup_path}")
+    print(f"  ✓ Added db_helpers import")
     return True
 
 def main():
@@ -119,11 +98,17 @@ def main():
     updated_count = 0
     skipped_count = 0
     
+    # Backups go outside lambda-functions so they are not packaged with the Lambda asset
+    backup_dir = os.path.join(
+        os.path.dirname(__file__), '..', 'backups',
+        f"secrets_manager_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    )
+    
     # Process all Python files
     for filename in os.listdir(lambda_dir):
-        if filename.endswith('.py') and not filename.endswith('.backup'):
+        if filename.endswith('.py') and filename != 'db_helpers.py':
             filepath = os.path.join(lambda_dir, filename)
-            if process_lambda_file(filepath):
+            if process_lambda_file(filepath, backup_dir):
                 updated_count += 1
             else:
                 skipped_count += 1
@@ -132,6 +117,8 @@ def main():
     print(f"Summary:")
     print(f"  Updated: {updated_count} files")
     print(f"  Skipped: {skipped_count} files")
+    if updated_count:
+        print(f"  Backups: {os.path.normpath(backup_dir)}")
     print("=" * 60)
     
     print("\nNext steps:")